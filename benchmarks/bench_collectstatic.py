@@ -0,0 +1,180 @@
+"""
+End-to-end scaling benchmark of the collectstatic_compress command.
+
+Every point of the scale runs in its own process, which generates a throwaway
+Django project with a synthetic static tree, runs the command in-process and
+records the wall time and memory peak of every phase from its --stats-json.
+The files grow with a fixed number of classes, then the classes grow with a
+fixed number of files.
+
+The command fails when a phase grows superlinearly between two points of an
+axis, that is when log(t2 / t1) / log(n2 / n1) is above the threshold.
+
+    $ python benchmarks/bench_collectstatic.py --files 100,1000,10000,50000 --classes 100,1000,10000,100000
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import make_static_tree  # noqa: E402
+
+PHASES = ['scan', 'names', 'copy', 'load', 'minify', 'compress', 'total']
+
+
+def run_point(point, result_file):
+    from django.conf import settings
+
+    directory = tempfile.mkdtemp(prefix='static_compressor_collect_')
+    try:
+        settings.configure(
+            DEBUG=False,
+            SECRET_KEY='benchmarks',
+            INSTALLED_APPS=['django.contrib.staticfiles', 'static_compressor'],
+            STATIC_URL='/static/',
+            STATIC_ROOT=os.path.join(directory, 'static_root'),
+            STATICFILES_DIRS=(os.path.join(directory, 'static'),),
+            STATICFILES_STORAGE='static_compressor.staticfiles_storage.CompressedStaticFilesStorage',
+            STATIC_CLASSES_FILE_NAME=os.path.join(directory, 'data.json'),
+            STATIC_COMPRESS_METHODS=point['methods'],
+            STATIC_COMPRESS_MIN_SIZE_KB=0,
+        )
+
+        import django
+        django.setup()
+
+        from django.core.management import call_command
+
+        make_static_tree(os.path.join(directory, 'static'), point['files'], point['classes'],
+                         point['file_kb'], point['seed'])
+
+        stats_json = os.path.join(directory, 'stats.json')
+        call_command('collectstatic_compress', interactive=False, verbosity=0, jobs=point['jobs'],
+                     stats_json=stats_json)
+
+        with open(stats_json) as f:
+            stats = json.load(f)
+
+        phases = dict((name, {'seconds': phase['wall_seconds'], 'peak_bytes': phase['peak_memory_bytes'] or 0})
+                      for (name, phase) in stats['phases'].items())
+        phases['total'] = {'seconds': stats['total']['wall_seconds'],
+                           'peak_bytes': stats['total']['peak_memory_bytes']}
+
+        with open(settings.STATIC_CLASSES_FILE_NAME) as f:
+            distinct_classes = len(json.load(f))
+
+        with open(result_file, 'w') as f:
+            json.dump(dict(point, distinct_classes=distinct_classes, phases=phases), f)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def measure_point(point):
+    (fd, result_file) = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        subprocess.run([sys.executable, '-W', 'ignore::UserWarning', os.path.abspath(__file__), '--run-point', json.dumps(point),
+                        '--result-file', result_file],
+                       check=True, stdout=subprocess.DEVNULL)
+        with open(result_file) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_file)
+
+
+def growth_failures(axis, results, args):
+    failures = list()
+
+    for (before, after) in zip(results, results[1:]):
+        scale = math.log(after[axis] / before[axis])
+        for phase in PHASES:
+            checks = [
+                ('seconds', args.max_time_exponent, args.min_seconds),
+                ('peak_bytes', args.max_memory_exponent, args.min_bytes),
+            ]
+            for (metric, max_exponent, minimum) in checks:
+                (a, b) = (before['phases'][phase][metric], after['phases'][phase][metric])
+                # Below the minimum, the constant costs and the noise dominate.
+                if a < minimum or b < minimum:
+                    continue
+                exponent = math.log(b / a) / scale
+                if exponent > max_exponent:
+                    failures.append('{phase} {metric} grows as {axis}^{exponent:.2f} from {a} to {b} {axis}'.format(
+                        phase=phase, metric=metric, axis=axis, exponent=exponent, a=before[axis], b=after[axis]))
+
+    return failures
+
+
+def print_result(result):
+    print('{files:>7} files {classes:>7} classes ({distinct_classes:>7} found)  '.format(**result) + '  '.join(
+        '{phase} {seconds:7.2f}s {peak:7.1f}MB'.format(
+            phase=phase, seconds=result['phases'][phase]['seconds'],
+            peak=result['phases'][phase]['peak_bytes'] / 1024 / 1024)
+        for phase in PHASES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', default='100,1000,10000,50000',
+                        help="Comma separated numbers of static files of the file axis.")
+    parser.add_argument('--classes', default='100,1000,10000,100000',
+                        help="Comma separated numbers of classes of the class axis.")
+    parser.add_argument('--fixed-files', type=int, default=300,
+                        help="Number of static files while the classes grow.")
+    parser.add_argument('--fixed-classes', type=int, default=1000,
+                        help="Number of classes while the files grow.")
+    parser.add_argument('--file-kb', type=int, default=4)
+    parser.add_argument('--methods', default='gz+zlib',
+                        help="Comma separated STATIC_COMPRESS_METHODS of the project.")
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-time-exponent', type=float, default=1.2)
+    parser.add_argument('--max-memory-exponent', type=float, default=1.2)
+    parser.add_argument('--min-seconds', type=float, default=0.2,
+                        help="Phases faster than this are not checked for growth.")
+    parser.add_argument('--min-bytes', type=int, default=4 * 1024 * 1024,
+                        help="Memory peaks smaller than this are not checked for growth.")
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    parser.add_argument('--run-point', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_point:
+        run_point(json.loads(args.run_point), args.result_file)
+        return
+
+    base = dict(file_kb=args.file_kb, methods=args.methods.split(','), jobs=args.jobs, seed=args.seed)
+    axes = {
+        'files': [dict(base, files=int(files), classes=args.fixed_classes) for files in args.files.split(',')],
+        'classes': [dict(base, files=args.fixed_files, classes=int(classes)) for classes in args.classes.split(',')],
+    }
+
+    results = dict()
+    failures = list()
+    for (axis, points) in axes.items():
+        print('Scaling the {axis}'.format(axis=axis))
+        results[axis] = list()
+        for point in points:
+            result = measure_point(point)
+            print_result(result)
+            results[axis].append(result)
+        failures.extend(growth_failures(axis, results[axis], args))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'arguments': vars(args), 'results': results, 'failures': failures}, f, indent=2)
+
+    for failure in failures:
+        print('SUPERLINEAR: ' + failure)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Micro-benchmarks of the hot paths of the package.
+
+Measures the latency and throughput of CompressMixin._minify,
+MinifyClassMiddleware.__call__, Command._create_json_file,
+Command._json_creation and the compressors, on a deterministic synthetic
+corpus, and writes the results as JSON so two runs can be compared with
+benchmarks/compare.py.
+
+    $ python benchmarks/bench_hot_paths.py --sizes-kb 16,128,512 --classes 2000 --output results.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import GENERATORS, make_class_map  # noqa: E402
+
+
+def configure_django(directory, json_file_name):
+    from django.conf import settings
+
+    settings.configure(
+        DEBUG=False,
+        SECRET_KEY='benchmarks',
+        ALLOWED_HOSTS=['testserver'],
+        INSTALLED_APPS=['django.contrib.staticfiles', 'static_compressor'],
+        STATIC_URL='/static/',
+        STATIC_ROOT=os.path.join(directory, 'static_root'),
+        STATICFILES_DIRS=(os.path.join(directory, 'static'),),
+        STATIC_CLASSES_FILE_NAME=json_file_name,
+        STATIC_INLINE_CSS=True,
+        MINIFY_CLASS_HTML=True,
+    )
+
+    import django
+    django.setup()
+
+
+def measure(function, repeat):
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def result(name, file_type, size, timings):
+    median = statistics.median(timings)
+    return {
+        'name': name,
+        'type': file_type,
+        'size_bytes': size,
+        'repeat': len(timings),
+        'min_s': min(timings),
+        'median_s': median,
+        'mb_per_s': size / median / 1024 / 1024 if median and size else None,
+    }
+
+
+def bench_minify(directory, corpus, repeat):
+    from django.core.files.base import ContentFile
+    from static_compressor.rewriter import ClassRewriter
+    from static_compressor.staticfiles_storage import CompressedStaticFilesStorage
+
+    storage = CompressedStaticFilesStorage(location=os.path.join(directory, 'minify'))
+    storage.data = corpus['data']
+    storage.rewriter = ClassRewriter(storage.data).compile_selectors()
+
+    results = list()
+    for (file_type, size_kb, content) in corpus['files']:
+        if file_type == 'html':
+            continue
+        name = 'bench.{extension}'.format(extension=file_type)
+        encoded = content.encode()
+
+        def run():
+            # _minify deletes and saves the file, so it gets a fresh copy every time.
+            for existing in (name,):
+                if storage.exists(existing):
+                    storage.delete(existing)
+            storage._save(name, ContentFile(encoded))
+            with storage.open(name) as file:
+                storage._minify(file, name, name)
+
+        results.append(result('CompressMixin._minify', file_type, len(encoded), measure(run, repeat)))
+    return results
+
+
+def bench_middleware(corpus, repeat):
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from static_compressor.middleware import MinifyClassMiddleware
+
+    results = list()
+    request = RequestFactory().get('/page/')
+
+    for (file_type, size_kb, content) in corpus['files']:
+        if file_type != 'html':
+            continue
+        encoded = content.encode()
+        middleware = MinifyClassMiddleware(lambda request: HttpResponse(encoded))
+        results.append(result('MinifyClassMiddleware.__call__', file_type, len(encoded),
+                              measure(lambda: middleware(request), repeat)))
+    return results
+
+
+def bench_create_json_file(directory, corpus, repeat):
+    from static_compressor.management.commands.collectstatic_compress import Command
+
+    root = os.path.join(directory, 'scan')
+    os.makedirs(root, exist_ok=True)
+    command = Command()
+
+    results = list()
+    for (file_type, size_kb, content) in corpus['files']:
+        if file_type == 'html':
+            continue
+        file = '{size}.{extension}'.format(size=size_kb, extension=file_type)
+        with open(os.path.join(root, file), 'w') as f:
+            f.write(content)
+        results.append(result('Command._create_json_file', file_type, len(content.encode()),
+                              measure(lambda: command._create_json_file(file, root), repeat)))
+    return results
+
+
+def bench_json_creation(corpus, repeat):
+    from collections import Counter
+    from static_compressor.management.commands.collectstatic_compress import Command
+
+    command = Command()
+    command.verbosity = 0
+    command.stable_names = False
+    command.repack = False
+    command.frequency = Counter(dict((name, index % 97 + 1) for (index, name) in enumerate(corpus['data'])))
+
+    # The size is the bytes of the original class names being assigned.
+    return [result('Command._json_creation', 'classes', sum(len(name) for name in command.frequency),
+                   measure(command._json_creation, repeat))]
+
+
+def bench_compressors(corpus, repeat):
+    from static_compressor.mixin import METHOD_MAPPING
+
+    results = list()
+    for (method, compressor_class) in sorted(METHOD_MAPPING.items()):
+        try:
+            compressor = compressor_class()
+        except Exception:
+            # An optional compressor without its package.
+            continue
+
+        for (file_type, size_kb, content) in corpus['files']:
+            if file_type not in ('css', 'js'):
+                continue
+            encoded = content.encode()
+            timings = measure(lambda: compressor.compress_to(io.BytesIO(encoded), io.BytesIO()), repeat)
+            results.append(result('{name} ({method})'.format(
+                name=compressor_class.__name__, method=method), file_type, len(encoded), timings))
+    return results
+
+
+BENCHMARKS = {
+    'minify': lambda directory, corpus, repeat: bench_minify(directory, corpus, repeat),
+    'middleware': lambda directory, corpus, repeat: bench_middleware(corpus, repeat),
+    'create_json_file': lambda directory, corpus, repeat: bench_create_json_file(directory, corpus, repeat),
+    'json_creation': lambda directory, corpus, repeat: bench_json_creation(corpus, repeat),
+    'compressors': lambda directory, corpus, repeat: bench_compressors(corpus, repeat),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes-kb', default='16,128,512',
+                        help="Comma separated sizes of the generated files.")
+    parser.add_argument('--classes', type=int, default=2000,
+                        help="Number of distinct classes in the corpus and data.json.")
+    parser.add_argument('--types', default='css,js,svg,html',
+                        help="Comma separated file types of the corpus.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help="Comma separated benchmarks to run, among {names}.".format(names=', '.join(BENCHMARKS)))
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    sizes_kb = [int(size) for size in args.sizes_kb.split(',')]
+    file_types = args.types.split(',')
+
+    data = make_class_map(args.classes, args.seed)
+    class_names = list(data)
+    corpus = {
+        'data': data,
+        'files': [(file_type, size_kb, GENERATORS[file_type](class_names, size_kb, args.seed))
+                  for file_type in file_types for size_kb in sizes_kb],
+    }
+
+    directory = tempfile.mkdtemp(prefix='static_compressor_bench_')
+    try:
+        json_file_name = os.path.join(directory, 'data.json')
+        with open(json_file_name, 'w') as f:
+            json.dump(data, f)
+
+        configure_django(directory, json_file_name)
+        os.chdir(directory)
+
+        results = list()
+        for name in args.only.split(','):
+            for entry in BENCHMARKS[name](directory, corpus, args.repeat):
+                print('{name:<40} {type:<8} {size_bytes:>10} B  {median_s:10.5f}s  {throughput}'.format(
+                    throughput='{:8.2f} MB/s'.format(entry['mb_per_s']) if entry['mb_per_s'] else '', **entry))
+                results.append(entry)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'classes': args.classes,
+                    'sizes_kb': sizes_kb,
+                    'repeat': args.repeat,
+                    'seed': args.seed,
+                },
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Benchmark for ClassRewriter.replace_selectors.
+
+Rewrites synthetic stylesheets of growing size against a fixed class map and
+prints the throughput for each size. A linear engine keeps the MB/s figure
+roughly constant while the file grows.
+
+    $ python benchmarks/bench_rewriter.py [number_of_classes]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import make_class_map, make_stylesheet  # noqa: E402
+from static_compressor.rewriter import ClassRewriter  # noqa: E402
+
+SIZES_KB = [25, 50, 100, 200, 400]
+
+
+def main():
+    number_of_classes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    data = make_class_map(number_of_classes)
+
+    start = time.perf_counter()
+    # The selector regex is compiled on first use, it's part of the build.
+    rewriter = ClassRewriter(data).compile_selectors()
+    print('Built rewriter for {count} classes in {seconds:.3f}s'.format(
+        count=number_of_classes, seconds=time.perf_counter() - start))
+
+    class_names = list(data)
+    for size_kb in SIZES_KB:
+        stylesheet = make_stylesheet(class_names, size_kb)
+        start = time.perf_counter()
+        rewriter.replace_selectors(stylesheet)
+        elapsed = time.perf_counter() - start
+        print('{size:>6} KB  {seconds:8.4f}s  {throughput:8.2f} MB/s'.format(
+            size=size_kb, seconds=elapsed, throughput=len(stylesheet) / elapsed / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
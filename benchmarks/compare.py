@@ -0,0 +1,56 @@
+"""
+Compare two result files of benchmarks/bench_hot_paths.py.
+
+Prints the ratio of the median times of every benchmark found in both files,
+and exits with status 1 when one of them got slower by more than the
+threshold, so it can gate a CI job.
+
+    $ python benchmarks/compare.py baseline.json results.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+
+def load(file_name):
+    with open(file_name) as f:
+        return dict(((entry['name'], entry['type'], entry['size_bytes']), entry)
+                    for entry in json.load(f)['results'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('results')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Fail when a median time grows by more than this fraction.")
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    results = load(args.results)
+
+    regressions = list()
+    for key in sorted(set(baseline) & set(results)):
+        before = baseline[key]['median_s']
+        after = results[key]['median_s']
+        ratio = after / before if before else 1
+        regressed = ratio - 1 > args.threshold
+        if regressed:
+            regressions.append(key)
+
+        print('{name:<40} {type:<8} {size:>10} B  {before:10.5f}s -> {after:10.5f}s  {ratio:6.2f}x{flag}'.format(
+            name=key[0], type=key[1], size=key[2], before=before, after=after, ratio=ratio,
+            flag='  REGRESSION' if regressed else ''))
+
+    missing = set(baseline) ^ set(results)
+    if missing:
+        print('{count} benchmarks are only in one of the files'.format(count=len(missing)))
+
+    if regressions:
+        print('{count} benchmarks are more than {percent:.0f}% slower'.format(
+            count=len(regressions), percent=args.threshold * 100))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
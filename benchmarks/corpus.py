@@ -0,0 +1,107 @@
+"""
+Deterministic synthetic corpus for the benchmarks.
+
+Every generator takes a seed, so two runs with the same arguments produce
+byte-identical files and their timings can be compared.
+"""
+import os
+import random
+import string
+
+
+def make_class_names(count, seed=0):
+    rand = random.Random(seed)
+    names = dict()
+    while len(names) < count:
+        name = '-'.join(''.join(rand.choice(string.ascii_lowercase) for _ in range(rand.randint(3, 8)))
+                        for _ in range(rand.randint(1, 3)))
+        names[name] = None
+    return list(names)
+
+
+def make_class_map(count, seed=0):
+    return dict((name, 'c{index}'.format(index=index))
+                for (index, name) in enumerate(make_class_names(count, seed)))
+
+
+def _fill(size_kb, make_chunk):
+    chunks = list()
+    total = 0
+    while total < size_kb * 1024:
+        chunk = make_chunk()
+        chunks.append(chunk)
+        total += len(chunk)
+    return ''.join(chunks)
+
+
+def make_stylesheet(class_names, size_kb, seed=0):
+    rand = random.Random(seed)
+    return _fill(size_kb, lambda: '.{first} .{second}:hover{{color:#{color:06x};margin:0 auto}}\n'.format(
+        first=rand.choice(class_names), second=rand.choice(class_names), color=rand.randrange(0xffffff)))
+
+
+def make_script(class_names, size_kb, seed=0):
+    rand = random.Random(seed)
+    templates = [
+        "document.querySelector('.{first} .{second}').focus();\n",
+        "document.querySelectorAll('.{first}').forEach(function (el) {{ el.hidden = true; }});\n",
+        "el.classList.add('{first}');\n",
+        "el.classList.toggle('{second}');\n",
+        "container.innerHTML = '<span class=\"{first} {second}\">' + label + '</span>';\n",
+        "var total = values.reduce(function (a, b) {{ return a + b; }}, 0);\n",
+    ]
+    return _fill(size_kb, lambda: rand.choice(templates).format(
+        first=rand.choice(class_names), second=rand.choice(class_names)))
+
+
+def make_svg(class_names, size_kb, seed=0):
+    rand = random.Random(seed)
+    body = _fill(size_kb, lambda: '<path class="{first} {second}" d="M{x} {y}L{y} {x}Z"/>\n'.format(
+        first=rand.choice(class_names), second=rand.choice(class_names),
+        x=rand.randrange(1000), y=rand.randrange(1000)))
+    return '<svg xmlns="http://www.w3.org/2000/svg"><style>.{name}{{fill:red}}</style>\n{body}</svg>\n'.format(
+        name=rand.choice(class_names), body=body)
+
+
+def make_html(class_names, size_kb, seed=0):
+    rand = random.Random(seed)
+    body = _fill(size_kb, lambda: '<div class="{first} {second} {unknown}"><a href="/item/{id}" class="{third}">Item {id}</a></div>\n'.format(
+        first=rand.choice(class_names), second=rand.choice(class_names), third=rand.choice(class_names),
+        unknown='js-hook', id=rand.randrange(100000)))
+    return '<!DOCTYPE html><html><head><style>.{name}{{display:flex}}</style></head><body>\n{body}</body></html>\n'.format(
+        name=rand.choice(class_names), body=body)
+
+
+GENERATORS = {
+    'css': make_stylesheet,
+    'js': make_script,
+    'svg': make_svg,
+    'html': make_html,
+}
+
+
+def make_static_tree(directory, files, classes, file_kb=4, seed=0):
+    """
+    Write a static tree of css, js and svg files, 100 files per directory,
+    which uses every one of the given number of classes.
+    """
+    class_names = make_class_names(classes, seed)
+    extensions = ['css', 'js', 'svg']
+    css_files = (files + len(extensions) - 1) // len(extensions)
+
+    for index in range(files):
+        extension = extensions[index % len(extensions)]
+        path = os.path.join(directory, 'app{number}'.format(number=index // 100),
+                            'file{index}.{extension}'.format(index=index, extension=extension))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        content = GENERATORS[extension](class_names, file_kb, seed + index)
+        if extension == 'css':
+            # Every class gets a rule in one of the stylesheets, whatever the sizes.
+            content = ''.join('.{name}{{color:red}}\n'.format(name=name)
+                              for name in class_names[index // len(extensions)::css_files]) + content
+
+        with open(path, 'w') as f:
+            f.write(content)
+
+    return class_names
@@ -16,7 +16,9 @@ setup(
     packages=find_packages(exclude=["tests"]),
     keywords="Django, class-minifier, compressor, pre-processor",
     include_package_data=True,
-    install_requires=["Django", "Brotli~=1.0.4", "zopfli~=0.1.4", "yaspin~=0.14.3"],
+    python_requires=">=3.7",
+    install_requires=["Django", "asgiref>=3.6", "Brotli~=1.0.4", "zopfli~=0.1.4", "yaspin~=0.14.3"],
+    extras_require={"zstd": ["zstandard"]},
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Environment :: Web Environment",
@@ -27,10 +29,11 @@ setup(
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
         "Programming Language :: Python :: 3 :: Only",
-        "Programming Language :: Python :: 3.4",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
         "Topic :: Software Development :: Pre-processors",
     ],
 )
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+
+__all__ = ["NameEncoder", "allocate_names", "names_report"]
+
+
+class NameEncoder:
+    """
+    Bijective base-N encoding of a rank into a class name over the salt.
+
+    The names come in the same order as itertools.product over the salt,
+    shortest first, but the names starting with a digit are skipped
+    arithmetically instead of being generated and filtered.
+    """
+
+    def __init__(self, alphabet):
+        self.alphabet = alphabet
+        self.leading = [char for char in alphabet if not char.isdigit()]
+
+        if not self.leading:
+            raise Exception(
+                'The CLASS_SALT_VALUE should contain at least one character which is not a digit')
+
+    def encode(self, rank):
+        base = len(self.alphabet)
+
+        # Find the length of the name, there are len(leading) * base ** (size - 1)
+        # names of every size.
+        size = 1
+        count = len(self.leading)
+        while rank >= count:
+            rank -= count
+            count *= base
+            size += 1
+
+        (first, rest) = divmod(rank, base ** (size - 1))
+
+        tail = list()
+        for _ in range(size - 1):
+            (rest, index) = divmod(rest, base)
+            tail.append(self.alphabet[index])
+
+        return self.leading[first] + ''.join(reversed(tail))
+
+    def iter_names(self, used_names):
+        rank = 0
+        while True:
+            name = self.encode(rank)
+            if name not in used_names:
+                yield name
+            rank += 1
+
+
+def allocate_names(weights, alphabet, previous_names=None, reserved_names=()):
+    """
+    Give every class a short name, so that the total size of the minified
+    files is as small as possible.
+
+    The weight of a class is the number of times it's used in the CSS, JS, SVG
+    and HTML files, so the shortest names go to the heaviest classes. A class
+    which is already as short as its name would be keeps its own name, and the
+    name goes to the next class instead. With previous_names, the classes keep
+    their previous name when it's still valid and only the new classes get a
+    new one. The reserved_names are never given as a short name, like the
+    classes only used in the templates.
+    """
+    order = sorted(weights, key=lambda key: (-weights[key], key))
+
+    names = dict()
+    # The original class names can never be used as a short name of another
+    # class, or both would collide in the minified files.
+    used_names = set(weights)
+    used_names.update(reserved_names)
+
+    if previous_names:
+        for key in order:
+            name = previous_names.get(key)
+            if name == key:
+                names[key] = key
+            elif name and name not in used_names:
+                names[key] = name
+                used_names.add(name)
+
+    generated_names = NameEncoder(alphabet).iter_names(used_names)
+    name = None
+
+    for key in order:
+        if key in names:
+            continue
+
+        if name is None:
+            name = next(generated_names)
+
+        if len(name) >= len(key):
+            names[key] = key
+        else:
+            names[key] = name
+            used_names.add(name)
+            name = None
+
+    return OrderedDict((key, names[key]) for key in order)
+
+
+def names_report(weights, names):
+    original_bytes = sum(weight * len(key) for (key, weight) in weights.items())
+    minified_bytes = sum(weights[key] * len(name) for (key, name) in names.items())
+
+    return {
+        'classes': len(names),
+        'original_bytes': original_bytes,
+        'minified_bytes': minified_bytes,
+        'saved_bytes': original_bytes - minified_bytes,
+    }
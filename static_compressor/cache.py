@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+
+__all__ = ["RewriteCache", "ExtractionCache", "CompressionCache"]
+
+
+class RewriteCache:
+    """
+    Bounded LRU cache of rewritten response bodies.
+
+    The entries are kept in process, and optionally in a Django cache backend
+    shared by all the workers. A key is the hash of the original body and the
+    version of the class map, so a new data.json never serves stale bodies.
+    """
+
+    def __init__(self, max_entries=256, max_size=32 * 1024 * 1024, max_entry_size=1024 * 1024, backend=None, timeout=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.backend = backend
+        self.timeout = timeout
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def make_key(self, content, version):
+        return 'static_compressor:{version}:{digest}'.format(
+            version=version, digest=hashlib.blake2b(content, digest_size=16).hexdigest())
+
+    def _store(self, key, value):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+
+        self.entries[key] = value
+        self.size += len(value)
+
+        while len(self.entries) > self.max_entries or self.size > self.max_size:
+            (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                with self.lock:
+                    self._store(key, value)
+                    self.hits += 1
+                return value
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        if len(value) > self.max_entry_size:
+            return
+
+        with self.lock:
+            self._store(key, value)
+
+        if self.backend is not None:
+            self.backend.set(key, value, self.timeout)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def file_digest(path, digest=None):
+    if digest is None:
+        digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Persistent cache of the class names counted in every static file.
+
+    A file is identified by its path, size, mtime and content hash. The total
+    frequency of all files is stored as well and is updated by the difference
+    of the changed files only, so a run where nothing changed doesn't read a
+    single static file.
+    """
+    version = 1
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.files = dict()
+        self.frequency = Counter()
+
+        try:
+            with open(self.file_name) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if cache.get('version') == self.version:
+            self.files = cache['files']
+            self.frequency = Counter(cache['frequency'])
+
+    def lookup(self, path, stat):
+        """
+        Return whether the file is unchanged, and its content hash when it
+        had to be computed, to be given back to update.
+        """
+        entry = self.files.get(path)
+        if entry is None:
+            return (False, None)
+
+        if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return (True, None)
+
+        if entry['size'] != stat.st_size:
+            return (False, None)
+
+        # The file was touched, but it may still have the same content.
+        digest = file_digest(path)
+        if entry['hash'] == digest:
+            entry['mtime'] = stat.st_mtime
+            return (True, digest)
+
+        return (False, digest)
+
+    def _discard(self, path):
+        entry = self.files.pop(path, None)
+        if entry is not None:
+            self.frequency.subtract(entry['classes'])
+
+    def update(self, path, stat, classes, digest=None):
+        self._discard(path)
+        self.files[path] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'hash': digest or file_digest(path),
+            'classes': dict(classes),
+        }
+        self.frequency.update(classes)
+
+    def remove_missing(self, paths):
+        for path in set(self.files) - set(paths):
+            self._discard(path)
+
+    def save(self):
+        # Drop the classes which aren't used anymore.
+        self.frequency = +self.frequency
+
+        with open(self.file_name, 'w') as outfile:
+            json.dump({
+                'version': self.version,
+                'frequency': self.frequency,
+                'files': self.files,
+            }, outfile, separators=(',', ':'))
+
+
+class CompressionCache:
+    """
+    Directory of compressed files addressed by the sha256 of their source,
+    shared across builds, branches and releases.
+
+    The key also holds the compressor and its options, so changing them never
+    returns an outdated file. Hits refresh the mtime of the entry, which is
+    used to evict the least recently used entries above the size cap.
+    """
+
+    def __init__(self, directory, max_size=1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+
+    def make_key(self, digest, compressor):
+        return '{digest}.{name}-{signature}.{extension}'.format(
+            digest=digest,
+            name=type(compressor).__name__.lower(),
+            signature=compressor.signature(),
+            extension=compressor.extension)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key, output):
+        """
+        Copy the cached file into the output file object, and return whether
+        it was found.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, output)
+        except FileNotFoundError:
+            return False
+
+        os.utime(path)
+        return True
+
+    def set(self, key, source_path):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Several processes may write the same entry, the rename keeps every
+        # reader from seeing a partially written file.
+        (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f, open(source_path, 'rb') as source:
+            shutil.copyfileobj(source, f)
+        os.replace(temp_path, path)
+
+    def evict(self):
+        entries = list()
+        total_size = 0
+
+        for (root, dirs, files) in os.walk(self.directory):
+            for file in files:
+                stat = os.stat(os.path.join(root, file))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, file)))
+                total_size += stat.st_size
+
+        for (mtime, size, path) in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
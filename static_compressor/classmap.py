@@ -0,0 +1,283 @@
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections.abc import Mapping
+
+from static_compressor.rewriter import ClassRewriter, load_class_map
+
+__all__ = ["MappedClassMap", "write_class_map", "open_class_map", "ClassMapWatcher"]
+
+# Magic, format version, number of classes, slots of the hash table and the
+# version of the class map, followed by the offsets of the keys and values,
+# the hash table and the sorted keys and values blobs. The integers are
+# little-endian unsigned 32 bits.
+HEADER = struct.Struct('<4sIII8s')
+MAGIC = b'SCCM'
+FORMAT_VERSION = 1
+EMPTY_SLOT = 0xffffffff
+
+# Class names looked up at least once, kept in every process.
+MEMO_SIZE = 4096
+
+
+def class_map_version(data):
+    # The same version as ClassRewriter, so the caches of rewritten content
+    # don't depend on the format of the map.
+    return hashlib.blake2b(json.dumps(data, sort_keys=True).encode(), digest_size=8).digest()
+
+
+def _uint32_array(values):
+    result = array.array('I', values)
+    if sys.byteorder == 'big':
+        result.byteswap()
+    return result
+
+
+def write_class_map(file_name, data):
+    """
+    Write the class map in the binary format read by MappedClassMap.
+
+    The file is replaced atomically, so the processes which mapped the old
+    one keep reading it until they reload.
+    """
+    items = sorted((key.encode(), value.encode()) for (key, value) in data.items())
+
+    table_size = 2
+    while table_size < len(items) * 2:
+        table_size *= 2
+
+    table = [EMPTY_SLOT] * table_size
+    for (index, (key, value)) in enumerate(items):
+        slot = zlib.crc32(key) & (table_size - 1)
+        while table[slot] != EMPTY_SLOT:
+            slot = (slot + 1) & (table_size - 1)
+        table[slot] = index
+
+    key_offsets = [0]
+    value_offsets = [0]
+    for (key, value) in items:
+        key_offsets.append(key_offsets[-1] + len(key))
+        value_offsets.append(value_offsets[-1] + len(value))
+
+    directory = os.path.dirname(os.path.abspath(file_name))
+    (fd, temp_path) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(items), table_size, class_map_version(data)))
+            f.write(_uint32_array(key_offsets).tobytes())
+            f.write(_uint32_array(value_offsets).tobytes())
+            f.write(_uint32_array(table).tobytes())
+            f.write(b''.join(key for (key, value) in items))
+            f.write(b''.join(value for (key, value) in items))
+        # mkstemp creates the file readable by its owner only, the workers
+        # may run as another user.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, file_name)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+class MappedClassMap(Mapping):
+    """
+    Read-only class map backed by a memory mapped file written by
+    write_class_map.
+
+    The pages of the file are shared by every process mapping it, instead of
+    every worker holding its own dict of the whole map.
+    """
+
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            (magic, format_version, self.count, table_size, version) = HEADER.unpack_from(self.mmap)
+        except struct.error:
+            raise ValueError("{file_name} is not a class map".format(file_name=file_name))
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError("{file_name} is not a class map of version {version}".format(
+                file_name=file_name, version=FORMAT_VERSION))
+
+        self.version = version.hex()
+
+        offset = HEADER.size
+        self.key_offsets = self._uint32_view(offset, self.count + 1)
+        offset += (self.count + 1) * 4
+        self.value_offsets = self._uint32_view(offset, self.count + 1)
+        offset += (self.count + 1) * 4
+        self.table = self._uint32_view(offset, table_size)
+        offset += table_size * 4
+
+        self.keys_start = offset
+        self.values_start = offset + self.key_offsets[self.count]
+        self.mask = table_size - 1
+        self.memo = dict()
+
+    def _uint32_view(self, offset, count):
+        view = memoryview(self.mmap)[offset:offset + count * 4]
+        if sys.byteorder == 'little':
+            return view.cast('I')
+        # Big-endian processes keep their own swapped copy of the offsets.
+        result = array.array('I', view.tobytes())
+        result.byteswap()
+        return result
+
+    def _key(self, index):
+        return self.mmap[self.keys_start + self.key_offsets[index]:self.keys_start + self.key_offsets[index + 1]]
+
+    def _value(self, index):
+        return self.mmap[self.values_start + self.value_offsets[index]:
+                         self.values_start + self.value_offsets[index + 1]].decode()
+
+    def _find(self, key):
+        try:
+            encoded = key.encode()
+        except (AttributeError, UnicodeEncodeError):
+            return None
+
+        slot = zlib.crc32(encoded) & self.mask
+        while True:
+            index = self.table[slot]
+            if index == EMPTY_SLOT:
+                return None
+            if self._key(index) == encoded:
+                return index
+            slot = (slot + 1) & self.mask
+
+    def get(self, key, default=None):
+        value = self.memo.get(key)
+        if value is not None:
+            return value
+
+        index = self._find(key)
+        if index is None:
+            return default
+
+        value = self._value(index)
+        if len(self.memo) >= MEMO_SIZE:
+            self.memo.clear()
+        self.memo[key] = value
+        return value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self.memo or self._find(key) is not None
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self._key(index).decode()
+
+    def __len__(self):
+        return self.count
+
+
+def open_class_map(json_file_name, map_file_name):
+    """
+    The binary class map when it's at least as recent as the JSON file,
+    otherwise the JSON file loaded in a dict.
+    """
+    try:
+        map_mtime = os.stat(map_file_name).st_mtime_ns
+    except OSError:
+        return load_class_map(json_file_name)
+
+    try:
+        json_mtime = os.stat(json_file_name).st_mtime_ns
+    except OSError:
+        json_mtime = 0
+
+    if map_mtime < json_mtime:
+        return load_class_map(json_file_name)
+    return MappedClassMap(map_file_name)
+
+
+class ClassMapWatcher:
+    """
+    Holds the ClassRewriter of the current class map, and replaces it when
+    the JSON or binary file changed, without restarting the process.
+
+    The files are checked at most once per interval seconds, never with an
+    interval of None. The new rewriter is built in a background thread and
+    swapped in one assignment, so a request keeps the rewriter it started
+    with and none waits for the reload.
+
+    With compile_selectors the selector regex of every rewriter is compiled
+    before it's used, at startup and on reload, and not by the first request
+    rewriting a selector.
+    """
+
+    def __init__(self, json_file_name, map_file_name, interval=2, compile_selectors=False):
+        self.json_file_name = json_file_name
+        self.map_file_name = map_file_name
+        self.interval = interval
+        self.compile_selectors = compile_selectors
+        self.lock = threading.Lock()
+        self.reload_thread = None
+
+        self.signature = self._signature()
+        self.rewriter = self._load()
+        self.next_check = time.monotonic() + (interval or 0)
+
+    def _load(self):
+        rewriter = ClassRewriter(open_class_map(self.json_file_name, self.map_file_name))
+        if self.compile_selectors:
+            rewriter.compile_selectors()
+        return rewriter
+
+    def _signature(self):
+        signature = list()
+        for file_name in (self.json_file_name, self.map_file_name):
+            try:
+                stat = os.stat(file_name)
+                signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return signature
+
+    def get(self):
+        if self.interval is None or time.monotonic() < self.next_check:
+            return self.rewriter
+
+        # Only one thread checks and reloads, the others keep the current
+        # rewriter.
+        if not self.lock.acquire(blocking=False):
+            return self.rewriter
+
+        self.next_check = time.monotonic() + self.interval
+        signature = self._signature()
+        if signature == self.signature:
+            self.lock.release()
+            return self.rewriter
+
+        # Building the rewriter of a big class map takes about a second, the
+        # requests keep the current one until the new one is ready.
+        self.reload_thread = threading.Thread(
+            target=self._reload, args=(signature,), name='static-compressor-reload', daemon=True)
+        self.reload_thread.start()
+        return self.rewriter
+
+    def _reload(self, signature):
+        try:
+            self.rewriter = self._load()
+            self.signature = signature
+        except (OSError, ValueError):
+            # A JSON file being written, the next check retries.
+            pass
+        finally:
+            self.lock.release()
@@ -1,27 +1,135 @@
-import gzip
+import io
+import itertools
+import zlib
 import brotli
 from zopfli import gzip as zopfli
+from django.core.exceptions import ImproperlyConfigured
 from django.core.files.base import ContentFile
 
-__all__ = ["BrotliCompressor", "ZlibCompressor", "ZopfliCompressor"]
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
+__all__ = ["BrotliCompressor", "ZlibCompressor", "ZopfliCompressor", "ZstdCompressor"]
+
+CHUNK_SIZE = 64 * 1024
+
+
+def read_chunks(file, chunk_size=CHUNK_SIZE):
+    return iter(lambda: file.read(chunk_size), b'')
 
-class BrotliCompressor:
-    extension = "br"
+
+class Compressor:
+    extension = None
 
     def compress(self, path, file):
-        return ContentFile(brotli.compress(file.read()))
+        output = io.BytesIO()
+        self.compress_to(file, output)
+        return ContentFile(output.getvalue())
+
+    def signature(self):
+        """
+        Identify the options changing the compressed output, for the cache.
+        """
+        return 'default'
+
+    def compress_to(self, file, output):
+        """
+        Compress the file into the output file object, reading and writing it
+        chunk by chunk so the memory used doesn't depend on the file size.
+        """
+        raise NotImplementedError
 
 
-class ZlibCompressor:
+class BrotliCompressor(Compressor):
+    extension = "br"
+
+    def __init__(self, quality=11):
+        self.quality = quality
+
+    def signature(self):
+        return 'quality{quality}'.format(quality=self.quality)
+
+    def compress_to(self, file, output):
+        compressor = brotli.Compressor(quality=self.quality)
+        for chunk in read_chunks(file):
+            output.write(compressor.process(chunk))
+        output.write(compressor.finish())
+
+
+class ZlibCompressor(Compressor):
     extension = "gz"
 
-    def compress(self, path, file):
-        return ContentFile(gzip.compress(file.read()))
+    def __init__(self, level=9):
+        self.level = level
 
+    def signature(self):
+        return 'level{level}'.format(level=self.level)
 
-class ZopfliCompressor:
+    def compress_chunks(self, chunks, output):
+        # 31 as wbits writes a gzip header and trailer around the deflate stream.
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            output.write(compressor.compress(chunk))
+        output.write(compressor.flush())
+
+    def compress_to(self, file, output):
+        self.compress_chunks(read_chunks(file), output)
+
+
+class ZopfliCompressor(Compressor):
     extension = "gz"
 
-    def compress(self, path, file):
-        return ContentFile(zopfli.compress(file.read()))
+    def __init__(self, max_size=16 * 1024 * 1024):
+        # Zopfli has no incremental API, so only the files up to max_size are
+        # read in memory, the bigger ones are streamed through zlib.
+        self.max_size = max_size
+
+    def signature(self):
+        # The files bigger than max_size are compressed by zlib instead.
+        return 'max{max_size}'.format(max_size=self.max_size)
+
+    def compress_to(self, file, output):
+        # Read chunk by chunk, so the buffer grows with the file instead of
+        # reserving max_size bytes for every file.
+        chunks = list()
+        size = 0
+        for chunk in read_chunks(file):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self.max_size:
+                ZlibCompressor().compress_chunks(
+                    itertools.chain(chunks, read_chunks(file)), output)
+                return
+
+        output.write(zopfli.compress(b''.join(chunks)))
+
+
+class ZstdCompressor(Compressor):
+    extension = "zst"
+
+    def __init__(self, level=19, long_distance=False, window_log=None):
+        if zstandard is None:
+            raise ImproperlyConfigured(
+                "STATIC_COMPRESS_METHODS: zst requires the zstandard package, "
+                "install it with pip install django-static-class-minifier[zstd].")
+
+        self.level = level
+        self.long_distance = long_distance
+        # Browsers only accept windows up to 8 MB, so the window is left to
+        # the level unless it's set explicitly.
+        self.window_log = window_log
+
+    def signature(self):
+        return 'level{level}-ldm{long_distance:d}-window{window_log}'.format(
+            level=self.level, long_distance=self.long_distance, window_log=self.window_log or 0)
+
+    def compress_to(self, file, output):
+        options = dict(enable_ldm=self.long_distance)
+        if self.window_log:
+            options['window_log'] = self.window_log
+
+        compressor = zstandard.ZstdCompressor(
+            compression_params=zstandard.ZstdCompressionParameters.from_level(self.level, **options))
+        compressor.copy_stream(file, output, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
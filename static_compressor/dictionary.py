@@ -0,0 +1,87 @@
+import hashlib
+
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = ["DictionaryCompressor", "read_dictionary_digest"]
+
+# Header of the dictionary-compressed Zstandard format (Content-Encoding: dcz),
+# followed by the SHA-256 of the dictionary.
+DCZ_MAGIC = b'\x5e\x2a\x4d\x18\x20\x00\x00\x00'
+
+
+def read_dictionary_digest(path):
+    """
+    The SHA-256 of the dictionary a .dcz file was compressed with, or None.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(len(DCZ_MAGIC) + 32)
+    if len(header) != len(DCZ_MAGIC) + 32 or not header.startswith(DCZ_MAGIC):
+        return None
+    return header[len(DCZ_MAGIC):]
+
+
+class DictionaryCompressor:
+    """
+    Compresses small static files against a Zstandard dictionary trained on
+    the static files themselves, so the boilerplate they share isn't paid by
+    every file.
+    """
+    extension = "dcz"
+
+    def __init__(self, level=19):
+        if zstandard is None:
+            raise ImproperlyConfigured(
+                "STATIC_COMPRESS_DICTIONARY requires the zstandard package, "
+                "install it with pip install django-static-class-minifier[zstd].")
+
+        self.level = level
+        self.dictionary = None
+
+    def train(self, samples, size):
+        """
+        Train the dictionary, and return whether there were enough samples.
+        """
+        try:
+            dictionary = zstandard.train_dictionary(size, samples, level=self.level)
+        except zstandard.ZstdError:
+            return False
+
+        self._load(dictionary.as_bytes())
+        return True
+
+    def _load(self, content):
+        self.content = content
+        self.dictionary = zstandard.ZstdCompressionDict(content)
+        self.digest = hashlib.sha256(self.content).digest()
+        self.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+        self.plain_compressor = zstandard.ZstdCompressor(level=self.level)
+
+    def __getstate__(self):
+        # The zstandard objects can't be pickled, the worker processes of the
+        # parallel compression build them again from the dictionary.
+        return {'level': self.level, 'content': self.content}
+
+    def __setstate__(self, state):
+        self.level = state['level']
+        self._load(state['content'])
+
+    def dictionary_name(self, name):
+        return '{name}.{version}.dict'.format(name=name, version=self.digest.hex()[:12])
+
+    def compress(self, content):
+        return DCZ_MAGIC + self.digest + self.compressor.compress(content)
+
+    def report(self, name, content, compressed):
+        plain_size = len(self.plain_compressor.compress(content))
+        return {
+            'name': name,
+            'size': len(content),
+            'zstd_size': plain_size,
+            'dictionary_size': len(compressed),
+            'gain': 1 - len(compressed) / plain_size if plain_size else 0,
+        }
@@ -0,0 +1,40 @@
+import os
+
+from django.conf import settings
+from jinja2.ext import Extension
+
+from static_compressor.classmap import open_class_map
+from static_compressor.rewriter import ClassRewriter
+
+__all__ = ["ClassMinifyExtension"]
+
+
+class ClassMinifyExtension(Extension):
+    """
+    Jinja2 extension which minifies the literal class names of the templates
+    before they are compiled. Jinja2 caches the compiled templates, so this
+    happens once per template and process.
+
+    TEMPLATES = [{
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'OPTIONS': {
+            'extensions': ['static_compressor.jinja2.ClassMinifyExtension'],
+        },
+    }]
+    """
+
+    def __init__(self, environment):
+        super().__init__(environment)
+
+        self.rewriter = None
+
+        if getattr(settings, "MINIFY_CLASS_HTML", False):
+            json_file_name = getattr(settings, "STATIC_CLASSES_FILE_NAME", 'data.json')
+            self.rewriter = ClassRewriter(open_class_map(json_file_name, getattr(
+                settings, "STATIC_CLASSES_MAP_FILE_NAME", os.path.splitext(json_file_name)[0] + '.map')))
+
+    def preprocess(self, source, name, filename=None):
+        if self.rewriter is None:
+            return source
+
+        return self.rewriter.replace_template_source(source)
@@ -0,0 +1,92 @@
+import os
+
+from django.conf import settings
+from django.template.loaders import cached
+
+from static_compressor.classmap import ClassMapWatcher
+
+__all__ = ["Loader", "minifies_templates"]
+
+LOADER = 'static_compressor.loaders.Loader'
+JINJA2_EXTENSION = 'static_compressor.jinja2.ClassMinifyExtension'
+
+
+def _has_loader(loaders):
+    for loader in loaders:
+        if isinstance(loader, (list, tuple)):
+            # ('cached.Loader', [...]) wraps other loaders.
+            if loader[0] == LOADER or (len(loader) > 1 and _has_loader(loader[1])):
+                return True
+        elif loader == LOADER:
+            return True
+    return False
+
+
+def minifies_templates(templates=None):
+    """
+    Whether a backend of TEMPLATES minifies the class names of the templates
+    with Loader or ClassMinifyExtension.
+    """
+    if templates is None:
+        templates = getattr(settings, "TEMPLATES", [])
+
+    for backend in templates:
+        options = backend.get('OPTIONS', dict())
+        if _has_loader(options.get('loaders', [])):
+            return True
+        for extension in options.get('extensions', []):
+            if extension == JINJA2_EXTENSION or getattr(extension, '__name__', None) == 'ClassMinifyExtension':
+                return True
+    return False
+
+
+class Loader(cached.Loader):
+    """
+    Cached template loader which minifies the literal class names of the
+    templates once, when they are compiled.
+
+    TEMPLATES = [{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {
+            'loaders': [
+                ('static_compressor.loaders.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    }]
+    """
+
+    def __init__(self, engine, loaders):
+        super().__init__(engine, loaders)
+
+        self.class_map = None
+        self.rewriter = None
+
+        if getattr(settings, "MINIFY_CLASS_HTML", False):
+            json_file_name = getattr(settings, "STATIC_CLASSES_FILE_NAME", 'data.json')
+            self.class_map = ClassMapWatcher(
+                json_file_name,
+                getattr(settings, "STATIC_CLASSES_MAP_FILE_NAME", os.path.splitext(json_file_name)[0] + '.map'),
+                getattr(settings, "MINIFY_CLASS_RELOAD_INTERVAL", 2))
+            self.rewriter = self.class_map.get()
+
+    def get_template(self, template_name, skip=None):
+        if self.class_map is not None:
+            # The compiled templates hold the names of the previous class
+            # map, they are compiled again with the new one.
+            rewriter = self.class_map.get()
+            if rewriter is not self.rewriter:
+                self.reset()
+                self.rewriter = rewriter
+
+        return super().get_template(template_name, skip)
+
+    def get_contents(self, origin):
+        contents = super().get_contents(origin)
+
+        if self.rewriter is None:
+            return contents
+
+        return self.rewriter.replace_template_source(contents)
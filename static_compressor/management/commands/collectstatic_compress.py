@@ -1,10 +1,10 @@
 import os
 import shutil
-import itertools
 import re
 from string import ascii_lowercase, ascii_uppercase, ascii_letters
 import json
-from collections import OrderedDict
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 from django.apps import apps
 from django.contrib.staticfiles.finders import get_finders
@@ -15,6 +15,71 @@ from django.core.management.color import no_style
 from django.utils.functional import cached_property
 from django.conf import settings
 
+from static_compressor.allocator import allocate_names, names_report
+from static_compressor.cache import ExtractionCache
+from static_compressor.classmap import write_class_map
+from static_compressor.signals import build_finished
+from static_compressor.stats import BuildStats
+
+CSS_CLASS_REGEX = re.compile(
+    r'\.-?[_a-zA-Z]+[_a-zA-Z0-9-]*[^#+@+,+.+)+/+(+^+:+!+{+~+ +}+\'+\"+>+<+^+[+]')
+CSS_QUOTES_REGEX = re.compile(r"[\'\"].*?[\'\"]", re.DOTALL)
+CSS_COMMENTS_REGEX = re.compile(r"/\*.*?\*/", re.DOTALL)
+CSS_SINGLE_LINE_COMMENTS_REGEX = re.compile(r"//.*?\n")
+
+SVG_CLASS_ATTRIBUTE_REGEX = re.compile(r'class[ \t]*=[ \t]*"[^"]+"')
+
+JS_QUERY_SELECTOR_REGEX = re.compile(
+    r'querySelector\([\'\"][^\'\"]*?\.[^\'\"]*?[\'\"]\)')
+JS_QUERY_SELECTOR_ALL_REGEX = re.compile(
+    r'querySelectorAll\([\'\"][^\'\"]*?\.[^\'\"]*?[\'\"]\)')
+JS_SELECTOR_CLASS_REGEX = re.compile(r'\.[_a-zA-Z]+[_a-zA-Z0-9-]*')
+
+
+def extract_classes(path):
+    """
+    Count the class names used by a css, svg, js or html file.
+
+    It runs in the worker processes of the parallel scan, so it only returns
+    a Counter of the distinct class names instead of every occurrence.
+    """
+    classes = Counter()
+
+    if path.endswith('.css'):
+        with open(path) as f:
+            read_css_file = f.read()
+
+        # To remove quotes in css
+        remove_unwanted_css_fragments = CSS_QUOTES_REGEX.sub('', read_css_file)
+
+        # To remove stream of comments
+        remove_unwanted_css_fragments = CSS_COMMENTS_REGEX.sub(
+            '', remove_unwanted_css_fragments)
+
+        # To remove single line comments
+        remove_unwanted_css_fragments = CSS_SINGLE_LINE_COMMENTS_REGEX.sub(
+            '', remove_unwanted_css_fragments)
+
+        for class_instance in CSS_CLASS_REGEX.findall(remove_unwanted_css_fragments):
+            classes[class_instance[1:]] += 1
+
+    elif path.endswith('.svg') or path.endswith('.html'):
+        with open(path) as f:
+            read_svg_file = f.read()
+
+        for class_instance in SVG_CLASS_ATTRIBUTE_REGEX.findall(read_svg_file):
+            classes.update(class_instance[7:-1].split())
+
+    elif path.endswith('.js'):
+        with open(path) as f:
+            read_js_file = f.read()
+
+        for regex in (JS_QUERY_SELECTOR_ALL_REGEX, JS_QUERY_SELECTOR_REGEX):
+            for instance in JS_SELECTOR_CLASS_REGEX.findall(''.join(regex.findall(read_js_file))):
+                classes[instance[1:]] += 1
+
+    return classes
+
 
 class Command(BaseCommand):
     """
@@ -33,8 +98,9 @@ class Command(BaseCommand):
         self.storage = staticfiles_storage
         self.style = no_style()
 
-        self.frequency = dict()
-        self.collection_of_classes = list()
+        self.frequency = Counter()
+        self.template_frequency = Counter()
+        self.stats = BuildStats()
 
         self.exclude_js_files = getattr(
             settings, "EXCLUDE_STATIC_JS_FILES", [])
@@ -58,6 +124,30 @@ class Command(BaseCommand):
         self.json_file_name = getattr(
             settings, "STATIC_CLASSES_FILE_NAME", 'data.json')
 
+        self.use_class_cache = getattr(
+            settings, "STATIC_CLASSES_CACHE", False)
+
+        self.class_map_file_name = getattr(
+            settings, "STATIC_CLASSES_MAP_FILE_NAME",
+            os.path.splitext(self.json_file_name)[0] + '.map')
+
+        self.class_cache_file_name = getattr(
+            settings, "STATIC_CLASSES_CACHE_FILE_NAME",
+            os.path.splitext(self.json_file_name)[0] + '.cache.json')
+
+        # The templates are cached apart, their classes only weigh the others.
+        self.template_cache_file_name = os.path.splitext(self.class_cache_file_name)[0] + '.templates.json'
+
+        self.template_dirs = getattr(
+            settings, "STATIC_CLASSES_TEMPLATE_DIRS",
+            [directory for template in getattr(settings, "TEMPLATES", []) for directory in template.get('DIRS', [])])
+
+        self.stable_names = getattr(
+            settings, "STATIC_CLASSES_STABLE_NAMES", False)
+
+        self.repack_threshold = getattr(
+            settings, "STATIC_CLASSES_REPACK_THRESHOLD", 0.1)
+
         self.not_included_words = getattr(
             settings, "EXCLUDED_CLASSNAMES_FROM_MINIFYING", [])
 
@@ -139,6 +229,32 @@ class Command(BaseCommand):
             '--no-default-ignore', action='store_false', dest='use_default_ignore_patterns',
             help="Don't ignore the common private glob-style patterns (defaults to 'CVS', '.*' and '*~').",
         )
+        parser.add_argument(
+            '-j', '--jobs', type=int, default=None,
+            help="Number of processes used to compress the files, 0 uses every CPU "
+                 "(defaults to the STATIC_COMPRESS_JOBS setting).",
+        )
+        parser.add_argument(
+            '--dictionary', action='store_true', default=None,
+            help="Train a Zstandard dictionary on the small static files and compress them "
+                 "against it (defaults to the STATIC_COMPRESS_DICTIONARY setting).",
+        )
+        parser.add_argument(
+            '--repack', action='store_true',
+            help="Give every class a new name by frequency, even with STATIC_CLASSES_STABLE_NAMES.",
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help="Print the time, bytes and memory peak of every phase and file type, and the slowest files.",
+        )
+        parser.add_argument(
+            '--stats-json', metavar='PATH',
+            help="Write the same stats as --stats to a JSON file.",
+        )
+        parser.add_argument(
+            '--stats-slowest', type=int, default=10, metavar='N',
+            help="Number of slowest files listed in the stats.",
+        )
 
     def set_options(self, **options):
         """
@@ -156,6 +272,17 @@ class Command(BaseCommand):
         self.ignore_patterns = list(set(os.path.normpath(p)
                                         for p in ignore_patterns))
         self.post_process = options['post_process']
+        self.repack = options['repack']
+        self.dictionary = options['dictionary']
+        self.jobs = options['jobs']
+        if self.jobs is None:
+            self.jobs = getattr(settings, "STATIC_COMPRESS_JOBS", 1)
+        self.show_stats = options['stats']
+        self.stats_json = options['stats_json']
+        self.stats_slowest = options['stats_slowest']
+        # The signals get the stats anyway, but the memory is only traced
+        # when they are reported, tracemalloc slows everything down.
+        self.stats = BuildStats(trace_memory=self.show_stats or bool(self.stats_json))
 
     def collect(self):
         """
@@ -174,30 +301,34 @@ class Command(BaseCommand):
             handler = self.copy_file
 
         found_files = {}
-        for finder in get_finders():
-            for path, storage in finder.list(self.ignore_patterns):
-                # Prefix the relative path if the source storage contains it
-                if getattr(storage, 'prefix', None):
-                    prefixed_path = os.path.join(storage.prefix, path)
-                else:
-                    prefixed_path = path
+        with self.stats.phase('copy'):
+            for finder in get_finders():
+                for path, storage in finder.list(self.ignore_patterns):
+                    # Prefix the relative path if the source storage contains it
+                    if getattr(storage, 'prefix', None):
+                        prefixed_path = os.path.join(storage.prefix, path)
+                    else:
+                        prefixed_path = path
 
-                if prefixed_path not in found_files:
-                    found_files[prefixed_path] = (storage, path)
-                    handler(path, prefixed_path, storage)
-                else:
-                    self.log(
-                        "Found another file with the destination path '%s'. It "
-                        "will be ignored since only the first encountered file "
-                        "is collected. If this is not what you want, make sure "
-                        "every static file has a unique path." % prefixed_path,
-                        level=1,
-                    )
+                    if prefixed_path not in found_files:
+                        found_files[prefixed_path] = (storage, path)
+                        handler(path, prefixed_path, storage)
+                    else:
+                        self.log(
+                            "Found another file with the destination path '%s'. It "
+                            "will be ignored since only the first encountered file "
+                            "is collected. If this is not what you want, make sure "
+                            "every static file has a unique path." % prefixed_path,
+                            level=1,
+                        )
 
         # Storage backends may define a post_process() method.
         if self.post_process and hasattr(self.storage, 'post_process'):
             processor = self.storage.post_process(found_files,
-                                                  dry_run=self.dry_run)
+                                                  dry_run=self.dry_run,
+                                                  jobs=self.jobs,
+                                                  dictionary=self.dictionary,
+                                                  stats=self.stats)
             for original_path, processed_path, processed in processor:
                 if isinstance(processed, Exception):
                     self.stderr.write(
@@ -213,111 +344,142 @@ class Command(BaseCommand):
                 else:
                     self.log("Skipped post-processing '%s'" % original_path)
 
+            self.log_dictionary_report(getattr(self.storage, 'dictionary_report', None))
+
         return {
             'modified': self.copied_files + self.symlinked_files,
             'unmodified': self.unmodified_files,
             'post_processed': self.post_processed_files,
         }
 
-    def iter_all_strings(self, sorted_by_value):
-        for size in itertools.count(start=1):
-            for s in itertools.product(self.salt_value, repeat=size):
-                if "".join(s)[0].isdigit() == False and not "".join(s) in sorted_by_value:
-                    yield "".join(s)
+    def _is_file_excluded(self, file):
+        if file.endswith('.css'):
+            return file in self.exclude_css_files
+        if file.endswith('.svg'):
+            return file in self.exclude_svg_files
+        if file.endswith('.js'):
+            return file in self.exclude_js_files
+        return True
 
     def _create_json_file(self, file, root):
-        if file.endswith('.css') and file not in self.exclude_css_files:
-            read_css_file = open(os.path.join(root, file)).read()
+        if self._is_file_excluded(file):
+            return Counter()
+        return extract_classes(os.path.join(root, file))
+
+    def _collect_classes(self):
+        paths = [os.path.join(root, file)
+                 for directory in self.static_dir
+                 for root, dirs, files in os.walk(directory)
+                 for file in files if not self._is_file_excluded(file)]
+
+        template_paths = [os.path.join(root, file)
+                          for directory in self.template_dirs
+                          for root, dirs, files in os.walk(directory)
+                          for file in files if file.endswith('.html')]
+
+        if not self.use_class_cache:
+            for classes in self._extract_classes(template_paths):
+                self.template_frequency.update(classes)
+            self._count_classes(self._extract_classes(paths))
+            self.stats.add_bytes('scan', sum(os.path.getsize(path) for path in template_paths + paths))
+            return
 
-            # To remove quotes in css
-            remove_unwanted_css_fragments = re.sub(re.compile(
-                "[\'\"].*?[\'\"]", re.DOTALL), '', read_css_file)
+        self.template_frequency.update(self._cached_frequency(
+            template_paths, self.template_cache_file_name, 'templates'))
+        self._count_classes([self._cached_frequency(paths, self.class_cache_file_name, 'static files')])
 
-            # To remove stream of comments
-            remove_unwanted_css_fragments = re.sub(re.compile(
-                "/\*.*?\*/", re.DOTALL), '', remove_unwanted_css_fragments)
+    def _cached_frequency(self, paths, cache_file_name, kind):
+        cache = ExtractionCache(cache_file_name)
 
-            # To remove single line comments
-            remove_unwanted_css_fragments = re.sub(re.compile(
-                "//.*?\n"), '', remove_unwanted_css_fragments)
+        stats = dict()
+        digests = dict()
+        changed_paths = list()
+        for path in paths:
+            stats[path] = os.stat(path)
+            (unchanged, digests[path]) = cache.lookup(path, stats[path])
+            if not unchanged:
+                changed_paths.append(path)
 
-            regex = re.compile(
-                r'\.-?[_a-zA-Z]+[_a-zA-Z0-9-]*[^#+@+,+.+)+/+(+^+:+!+{+~+ +}+\'+\"+>+<+^+[+]')
+        for (path, classes) in zip(changed_paths, self._extract_classes(changed_paths)):
+            cache.update(path, stats[path], classes, digests[path])
+        self.stats.add_bytes('scan', sum(stats[path].st_size for path in changed_paths))
 
-            all_classes = regex.findall(
-                remove_unwanted_css_fragments)
-            for class_instance in all_classes:
-                word = class_instance[1:]
-                self.collection_of_classes.append(word)
+        cache.remove_missing(paths)
+        cache.save()
 
-        if file.endswith('.svg'):
-            if file not in self.exclude_svg_files:
-                read_svg_file = open(os.path.join(root, file)).read()
+        self.log("Scanned {changed} of {total} {kind} for classes".format(
+            changed=len(changed_paths), total=len(paths), kind=kind), level=1)
 
-                regex = re.compile(r'class[ \t]*=[ \t]*"[^"]+"')
-                all_classes = regex.findall(read_svg_file)
-                for class_instance in all_classes:
-                    for class_name in class_instance[7:-1].split():
-                        self.collection_of_classes.append(class_name)
+        return cache.frequency
 
-        if file.endswith('.js') and not file in self.exclude_js_files:
-            read_js_file = open(os.path.join(root, file)).read()
+    def _extract_classes(self, paths):
+        if self.jobs != 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=self.jobs or None) as executor:
+                yield from executor.map(extract_classes, paths, chunksize=32)
+        else:
+            yield from map(extract_classes, paths)
 
-            query_selector_regex = re.compile(
-                r'querySelector\([\'\"][^\'\"]*?\.[^\'\"]*?[\'\"]\)')
-            query_selector_classname = query_selector_regex.findall(
-                read_js_file)
+    def _count_classes(self, results):
+        not_included_words = set(self.not_included_words)
 
-            query_selector_all_regex = re.compile(
-                r'querySelectorAll\([\'\"][^\'\"]*?\.[^\'\"]*?[\'\"]\)')
-            query_selector_all_classname = query_selector_all_regex.findall(
-                read_js_file)
+        for classes in results:
+            for (word, count) in classes.items():
+                if not word in not_included_words:
+                    self.frequency[word.strip()] += count
 
-            get_element_by_classname_regex = re.compile(
-                r'getElementsByClassName\([\'\"]([^)]+)[\'\"]\)')
-            get_elements_by_classes = get_element_by_classname_regex.findall(
-                read_js_file)
+    def _class_weights(self):
+        # The template usages only weigh the classes found in the static files.
+        return dict((key, count + self.template_frequency[key])
+                    for (key, count) in self.frequency.items())
 
-            get_just_class_from_selectors = re.compile(
-                r'\.[_a-zA-Z]+[_a-zA-Z0-9-]*')
-            get_query_selector_class_name = get_just_class_from_selectors.findall(
-                ''.join(query_selector_classname))
+    def _assign_names(self, previous_names=None):
+        # A class only used in the templates keeps its name in the rendered
+        # HTML, so it can't be the short name of another class.
+        return allocate_names(self._class_weights(), self.salt_value, previous_names,
+                              reserved_names=self.template_frequency)
 
-            get_query_selector_all_class_name = get_just_class_from_selectors.findall(
-                ''.join(query_selector_all_classname))
+    def _load_previous_names(self):
+        try:
+            with open(self.json_file_name) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def _names_drift(self, names):
+        weights = self._class_weights()
+        optimal_bytes = names_report(weights, self._assign_names())['minified_bytes']
+        if not optimal_bytes:
+            return 0
+        return names_report(weights, names)['minified_bytes'] / optimal_bytes - 1
+
+    def _write_json_file(self, names):
+        sorted_by_key_length = OrderedDict(
+            sorted(names.items(), key=lambda x: len(x[0]), reverse=True))
 
-            for instance in get_query_selector_all_class_name:
-                self.collection_of_classes.append(instance[1:])
+        with open(self.json_file_name, 'w') as outfile:
+            json.dump(sorted_by_key_length, outfile,
+                      indent=4, separators=(',', ':'))
 
-            for instance in get_query_selector_class_name:
-                self.collection_of_classes.append(instance[1:])
+        # Written after the JSON file, so it's never older than it and the
+        # workers pick it up.
+        write_class_map(self.class_map_file_name, names)
 
     def _json_creation(self):
-        for word in self.collection_of_classes:
-            class_instance = word.strip()
+        if self.stable_names and not self.repack:
+            names = self._assign_names(self._load_previous_names())
 
-            if not word in self.not_included_words:
-                if not class_instance in self.frequency:
-                    self.frequency[class_instance] = 0
-                self.frequency[class_instance] += 1
-
-        length_of_frequency = len(self.frequency)
-
-        sorted_values_by_order = OrderedDict(
-            sorted(self.frequency.items(), key=lambda x: x[0], reverse=False))
-
-        sorted_by_value = OrderedDict(
-            sorted(sorted_values_by_order.items(), key=lambda x: x[1], reverse=True))
+            drift = self._names_drift(names)
+            if drift > self.repack_threshold:
+                self.log("The class names are {percent:.1f}% longer than a fresh assignment, "
+                         "consider running python manage.py repack_classes".format(percent=drift * 100), level=1)
+        else:
+            names = self._assign_names()
 
-        for (generated_code_word, key) in zip(itertools.islice(self.iter_all_strings(sorted_by_value), length_of_frequency), sorted_by_value.keys()):
-            sorted_by_value[key] = generated_code_word
+        report = names_report(self._class_weights(), names)
+        self.log("Minifying {classes} classes saves {saved_bytes} of {original_bytes} bytes "
+                 "of class names".format(**report), level=1)
 
-        sorted_by_key_length = OrderedDict(
-            sorted(sorted_by_value.items(), key=lambda x: len(x[0]), reverse=True))
-
-        with open(self.json_file_name, 'w') as outfile:
-            json.dump(sorted_by_key_length, outfile,
-                      indent=4, separators=(',', ':'))
+        self._write_json_file(names)
 
     def handle(self, **options):
         self.set_options(**options)
@@ -367,12 +529,14 @@ class Command(BaseCommand):
             if os.path.exists(self.static_root) and os.path.isdir(self.static_root):
                 shutil.rmtree(self.static_root)
 
-        for directory in self.static_dir:
-            for root, dirs, files in os.walk(directory):
-                for file in files:
-                    self._create_json_file(file, root)
+        self.stats.start()
 
-        self._json_creation()
+        with self.stats.phase('scan'):
+            self._collect_classes()
+
+        with self.stats.phase('names'):
+            self._json_creation()
+        self.stats.add_bytes('names', bytes_out=os.path.getsize(self.json_file_name))
 
         message.append(
             'Initialized {file_name} json file'.format(
@@ -380,6 +544,11 @@ class Command(BaseCommand):
         )
 
         collected = self.collect()
+
+        self.stats.finish()
+        build_finished.send(sender=self.__class__, stats=self.stats)
+        self.report_stats()
+
         modified_count = len(collected['modified'])
         unmodified_count = len(collected['unmodified'])
         post_processed_count = len(collected['post_processed'])
@@ -399,6 +568,30 @@ class Command(BaseCommand):
             }
             return summary
 
+    def report_stats(self):
+        if self.show_stats:
+            for line in self.stats.report(self.stats_slowest):
+                self.stdout.write(line)
+
+        if self.stats_json:
+            with open(self.stats_json, 'w') as f:
+                json.dump(self.stats.as_dict(self.stats_slowest), f, indent=4)
+
+    def log_dictionary_report(self, report):
+        if not report:
+            return
+
+        for entry in report:
+            self.log("Dictionary compressed '{name}': {zstd_size} -> {dictionary_size} bytes "
+                     "({gain:.1%} smaller)".format(**entry), level=2)
+
+        zstd_size = sum(entry['zstd_size'] for entry in report)
+        dictionary_size = sum(entry['dictionary_size'] for entry in report)
+        self.log("Dictionary compressed {count} files: {zstd_size} -> {dictionary_size} bytes "
+                 "({gain:.1%} smaller than zstd alone)".format(
+                     count=len(report), zstd_size=zstd_size, dictionary_size=dictionary_size,
+                     gain=1 - dictionary_size / zstd_size if zstd_size else 0), level=1)
+
     def log(self, msg, level=2):
         """
         Small log helper
@@ -544,4 +737,5 @@ class Command(BaseCommand):
             self.log("Copying '%s'" % source_path, level=2)
             with source_storage.open(path) as source_file:
                 self.storage.save(prefixed_path, source_file)
+                self.stats.add_bytes('copy', source_file.size, source_file.size)
         self.copied_files.append(prefixed_path)
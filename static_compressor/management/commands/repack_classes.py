@@ -0,0 +1,52 @@
+from django.conf import settings
+
+from static_compressor.management.commands.collectstatic_compress import Command as CollectStaticCompressCommand
+
+
+class Command(CollectStaticCompressCommand):
+    """
+    Gives the classes of the JSON file new names by frequency, when the stable
+    names kept by STATIC_CLASSES_STABLE_NAMES became too long.
+    """
+    help = "Reassign the minified class names when they drifted from the optimal assignment."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold', type=float, default=None,
+            help="Repack when the class names are this much longer than a fresh "
+                 "assignment, 0.1 is 10%% (defaults to the STATIC_CLASSES_REPACK_THRESHOLD setting).",
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Repack whatever the drift is.",
+        )
+        parser.add_argument(
+            '-j', '--jobs', type=int, default=None,
+            help="Number of processes used to scan the files, 0 uses every CPU "
+                 "(defaults to the STATIC_COMPRESS_JOBS setting).",
+        )
+
+    def handle(self, **options):
+        self.verbosity = options['verbosity']
+        self.jobs = options['jobs']
+        if self.jobs is None:
+            self.jobs = getattr(settings, "STATIC_COMPRESS_JOBS", 1)
+
+        threshold = options['threshold']
+        if threshold is None:
+            threshold = self.repack_threshold
+
+        self._collect_classes()
+
+        names = self._assign_names(self._load_previous_names())
+        drift = self._names_drift(names)
+
+        if drift <= threshold and not options['force']:
+            self.stdout.write("The class names are {percent:.1f}% longer than a fresh assignment, "
+                              "nothing to repack.".format(percent=drift * 100))
+            return
+
+        self._write_json_file(self._assign_names())
+        self.stdout.write("Repacked {count} class names in {file_name}, they were {percent:.1f}% longer "
+                          "than needed. Run python manage.py collectstatic_compress to apply them.".format(
+                              count=len(names), file_name=self.json_file_name, percent=drift * 100))
@@ -0,0 +1,157 @@
+import bisect
+import json
+import logging
+import random
+import threading
+from collections import Counter
+
+__all__ = ["Histogram", "MiddlewareMetrics", "middleware_metrics"]
+
+logger = logging.getLogger('static_compressor.metrics')
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """
+    Prometheus style histogram, the caller holds the lock of the metrics.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for (bound, count) in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class MiddlewareMetrics:
+    """
+    Counters and histograms of MinifyClassMiddleware in this process.
+
+    Every response is counted, but only a sample_rate fraction of the
+    rewritten ones is timed, measured and logged, which keeps the overhead
+    negligible under load. The lock is only held for a few additions.
+    """
+
+    def __init__(self, sample_rate=1.0, log=False):
+        self.sample_rate = sample_rate
+        self.log = log
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.responses = Counter()
+            self.sampled = 0
+            self.input_bytes = 0
+            self.output_bytes = 0
+            self.attributes = 0
+            self.duration = Histogram(DURATION_BUCKETS)
+            self.input_size = Histogram(SIZE_BUCKETS)
+            self.output_size = Histogram(SIZE_BUCKETS)
+
+    def should_sample(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def skipped(self, reason, path=None):
+        with self.lock:
+            self.responses[('skipped', reason)] += 1
+
+        if self.log and self.should_sample():
+            self._log({'event': 'skipped', 'reason': reason, 'path': path})
+
+    def rewritten(self, result):
+        with self.lock:
+            self.responses[(result, '')] += 1
+
+    def observe(self, seconds, input_bytes, output_bytes, attributes=None, cached=False, path=None):
+        """
+        Record a sampled rewrite. attributes is None when it isn't known, for
+        the bodies coming from the cache.
+        """
+        with self.lock:
+            self.sampled += 1
+            self.input_bytes += input_bytes
+            self.output_bytes += output_bytes
+            if attributes is not None:
+                self.attributes += attributes
+            self.duration.observe(seconds)
+            self.input_size.observe(input_bytes)
+            self.output_size.observe(output_bytes)
+
+        if self.log:
+            self._log({
+                'event': 'rewritten',
+                'path': path,
+                'seconds': round(seconds, 6),
+                'input_bytes': input_bytes,
+                'output_bytes': output_bytes,
+                'attributes': attributes,
+                'cached': cached,
+            })
+
+    def _log(self, record):
+        logger.info(json.dumps(record, sort_keys=True), extra={'metrics': record})
+
+    def prometheus(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        lines = list()
+
+        def metric(name, kind, help_text):
+            lines.append('# HELP {name} {help}'.format(name=name, help=help_text))
+            lines.append('# TYPE {name} {kind}'.format(name=name, kind=kind))
+
+        def histogram(name, help_text, histogram):
+            metric(name, 'histogram', help_text)
+            for (bound, count) in histogram.cumulative_counts():
+                lines.append('{name}_bucket{{le="{bound}"}} {count}'.format(name=name, bound=bound, count=count))
+            lines.append('{name}_sum {sum}'.format(name=name, sum=histogram.sum))
+            lines.append('{name}_count {count}'.format(name=name, count=histogram.count))
+
+        with self.lock:
+            metric('minify_class_responses_total', 'counter',
+                   'Responses seen by MinifyClassMiddleware, by result and skip reason.')
+            for ((result, reason), count) in sorted(self.responses.items()):
+                labels = 'result="{result}"'.format(result=result)
+                if reason:
+                    labels += ',reason="{reason}"'.format(reason=reason)
+                lines.append('minify_class_responses_total{{{labels}}} {count}'.format(labels=labels, count=count))
+
+            metric('minify_class_sampled_total', 'counter', 'Rewritten responses which were measured.')
+            lines.append('minify_class_sampled_total {count}'.format(count=self.sampled))
+
+            metric('minify_class_input_bytes_total', 'counter', 'Bytes of the measured responses before the rewrite.')
+            lines.append('minify_class_input_bytes_total {count}'.format(count=self.input_bytes))
+
+            metric('minify_class_output_bytes_total', 'counter', 'Bytes of the measured responses after the rewrite.')
+            lines.append('minify_class_output_bytes_total {count}'.format(count=self.output_bytes))
+
+            metric('minify_class_attributes_total', 'counter', 'Class attributes rewritten in the measured responses.')
+            lines.append('minify_class_attributes_total {count}'.format(count=self.attributes))
+
+            histogram('minify_class_rewrite_seconds', 'Duration of the rewrite of the measured responses.',
+                      self.duration)
+            histogram('minify_class_input_size_bytes', 'Size of the measured responses before the rewrite.',
+                      self.input_size)
+            histogram('minify_class_output_size_bytes', 'Size of the measured responses after the rewrite.',
+                      self.output_size)
+
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by the middleware and the metrics view of the process.
+middleware_metrics = MiddlewareMetrics()
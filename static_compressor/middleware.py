@@ -1,17 +1,48 @@
-import re
-import errno
 import os
-import json
+import zlib
+import hashlib
+import re
+import time
+import codecs
+import asyncio
+import brotli
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 
 from django.template.response import TemplateResponse
-from django.http import HttpResponse
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from static_compressor.cache import RewriteCache
+from static_compressor.classmap import ClassMapWatcher
+from static_compressor.loaders import minifies_templates
+from static_compressor.metrics import middleware_metrics
+from static_compressor.rewriter import is_ascii_compatible
+from static_compressor.serving import CompressedFilesIndex, parse_accept_encoding, serve_compressed
+
 
 class MinifyClassMiddleware:
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
 
+        # Under ASGI Django gives an async get_response, then the middleware
+        # is marked as a coroutine function and __call__ awaits it.
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+        self.async_threshold = getattr(
+            settings, "MINIFY_CLASS_ASYNC_THRESHOLD_KB", 64) * 1024
+        self.async_threads = getattr(
+            settings, "MINIFY_CLASS_ASYNC_THREADS", 4)
+        self.executor = None
+
         self.not_allowed_url_minification = getattr(
             settings, "EXCLUDE_URL_MINIFICATION", [])
 
@@ -24,53 +55,559 @@ class MinifyClassMiddleware:
         self.inline_style = getattr(
             settings, "STATIC_INLINE_CSS", False)
 
+        self.inline_script = getattr(
+            settings, "STATIC_INLINE_JS", False)
+
+        self.streaming = getattr(
+            settings, "MINIFY_CLASS_STREAMING", True)
+
+        self.streaming_buffer_size = getattr(
+            settings, "MINIFY_CLASS_STREAMING_BUFFER_KB", 64) * 1024
+
+        self.class_map_file_name = getattr(
+            settings, "STATIC_CLASSES_MAP_FILE_NAME", os.path.splitext(self.json_file_name)[0] + '.map')
+
+        # The class map has no boundary after the selectors, the inline
+        # styles already rewritten by the templates would be rewritten again.
+        if self.should_minify and self.inline_style and minifies_templates():
+            raise ImproperlyConfigured(
+                "STATIC_INLINE_CSS can't be used with static_compressor.loaders.Loader or "
+                "ClassMinifyExtension, they already rewrite the inline <style> blocks of the templates.")
+
+        self.inline_tags = [tag for (tag, enabled) in (('style', self.inline_style), ('script', self.inline_script))
+                            if enabled]
+        self.inline_regex = None
+        self.inline_bytes_regex = None
+        self.inline_start_bytes_regex = None
+
+        if self.inline_tags:
+            # The inline blocks and the class attributes are matched in one
+            # pass, so the class attributes of a script are rewritten once.
+            pattern = r'(?is:(<({tags})\b[^>]*>)(.*?)(</\2\s*>))|class[ \t]*=[ \t]*"([^"]+)"'.format(
+                tags='|'.join(self.inline_tags))
+            self.inline_regex = re.compile(pattern)
+            self.inline_bytes_regex = re.compile(pattern.encode())
+            self.inline_start_bytes_regex = re.compile(r'(?i)<(?:{tags})'.format(
+                tags='|'.join(self.inline_tags)).encode())
+
         if self.should_minify:
+            # The inline blocks rewrite selectors, their regex is compiled
+            # at startup instead of by the first request.
+            self.class_map = ClassMapWatcher(
+                self.json_file_name, self.class_map_file_name,
+                getattr(settings, "MINIFY_CLASS_RELOAD_INTERVAL", 2),
+                compile_selectors=bool(self.inline_tags))
+
+        self.inline_cache = None
+        inline_cache_max_entries = getattr(
+            settings, "MINIFY_CLASS_INLINE_CACHE_MAX_ENTRIES", 1024)
+
+        if self.should_minify and self.inline_tags and inline_cache_max_entries:
+            self.inline_cache = RewriteCache(
+                max_entries=inline_cache_max_entries,
+                max_size=getattr(settings, "MINIFY_CLASS_INLINE_CACHE_MAX_SIZE_KB", 4 * 1024) * 1024)
+
+        self.cache = None
+
+        if self.should_minify and getattr(settings, "MINIFY_CLASS_CACHE", False):
+            backend = getattr(settings, "MINIFY_CLASS_CACHE_BACKEND", None)
+            if backend is not None:
+                from django.core.cache import caches
+                backend = caches[backend]
+
+            self.cache = RewriteCache(
+                max_entries=getattr(settings, "MINIFY_CLASS_CACHE_MAX_ENTRIES", 256),
+                max_size=getattr(settings, "MINIFY_CLASS_CACHE_MAX_SIZE_KB", 32 * 1024) * 1024,
+                max_entry_size=getattr(settings, "MINIFY_CLASS_CACHE_MAX_ENTRY_KB", 1024) * 1024,
+                backend=backend,
+                timeout=getattr(settings, "MINIFY_CLASS_CACHE_TIMEOUT", 300))
+
+        self.compress = getattr(
+            settings, "MINIFY_CLASS_COMPRESS", False)
+
+        # 'content' hashes the rewritten body, 'derived' combines the ETag of
+        # the view with the version of the class map, None sets no ETag.
+        self.etag = getattr(
+            settings, "MINIFY_CLASS_ETAG", None)
+        if self.etag not in ('content', 'derived', None):
+            raise ImproperlyConfigured(
+                "MINIFY_CLASS_ETAG should be 'content', 'derived' or None.")
+
+        self.compress_min_size = getattr(
+            settings, "MINIFY_CLASS_COMPRESS_MIN_SIZE", 200)
+
+        self.brotli_quality = getattr(settings, "MINIFY_CLASS_BROTLI_QUALITY", 5)
+        self.gzip_level = getattr(settings, "MINIFY_CLASS_GZIP_LEVEL", 6)
+
+        # Content-Encoding and compressor, by order of preference.
+        self.compressors = [
+            ('br', self._compress_brotli),
+            ('gzip', self._compress_gzip),
+        ]
+
+        self.metrics = None
+
+        if getattr(settings, "MINIFY_CLASS_METRICS", False):
+            self.metrics = middleware_metrics
+            self.metrics.sample_rate = getattr(settings, "MINIFY_CLASS_METRICS_SAMPLE_RATE", 1.0)
+            self.metrics.log = getattr(settings, "MINIFY_CLASS_METRICS_LOG", False)
+
+    def _negotiate_encoding(self, request, response):
+        """
+        Return the Content-Encoding and compressor of the response, or None.
+        """
+        if not self.compress or response.has_header('Content-Encoding'):
+            return None
+        if len(response.content) < self.compress_min_size:
+            return None
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accepted = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for (encoding, compressor) in self.compressors:
+            if encoding in accepted:
+                return encoding, compressor
+        return None
+
+    def _compress_brotli(self, content):
+        return brotli.compress(content, quality=self.brotli_quality)
+
+    def _compress_gzip(self, content):
+        # 31 as wbits writes a gzip header and trailer around the deflate stream.
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+        return compressor.compress(content) + compressor.flush()
+
+    def _compress_response(self, response, encoding, compressor):
+        # The body is already in memory, so it's compressed in one call.
+        compressed = compressor(response.content)
+        # Return the original content when the compression doesn't help.
+        if len(compressed) >= len(response.content):
+            return False
+
+        response.content = compressed
+        response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(len(compressed))
+        return True
+
+    def _derived_etag(self, etag, rewriter):
+        # The original ETag and the version of the class map identify the
+        # rewritten body as well, without hashing it.
+        weak = etag.startswith('W/')
+        value = (etag[2:] if weak else etag).strip('"')
+        return '{weak}"{value}-{version}"'.format(
+            weak='W/' if weak else '', value=value, version=rewriter.version)
+
+    def _encoded_etag(self, etag, encoding):
+        # Every Content-Encoding is another representation, with its own ETag.
+        if encoding is None:
+            return etag
+        return etag[:-1] + '-' + encoding + '"'
+
+    def _not_modified(self, request, response):
+        # As ConditionalGetMiddleware, a 201 or 206 is never a 304.
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return None
+
+        conditional = get_conditional_response(request, etag=response['ETag'], response=response)
+        if conditional is response:
+            return None
+        return conditional
+
+    def _rewrite_inline_block(self, tag, block, rewriter, charset=None):
+        """
+        Rewrite the content of an inline <style> or <script> with the rules
+        of the static files. The block is bytes in the charset, or text when
+        charset is None.
+
+        The rewritten blocks are memoised by their hash, so a block repeated
+        on every page is only rewritten once.
+        """
+        if not block.strip():
+            return block
+
+        key = None
+        if self.inline_cache is not None:
+            key = self.inline_cache.make_key(
+                block if charset is not None else block.encode(),
+                '{version}:{charset}:{tag}'.format(version=rewriter.version, charset=charset, tag=tag))
+            rewritten = self.inline_cache.get(key)
+            if rewritten is not None:
+                return rewritten
+
+        rewrite = rewriter.replace_stylesheet if tag == 'style' else rewriter.replace_script
+        try:
+            if charset is None:
+                rewritten = rewrite(block)
+            else:
+                rewritten = rewrite(bytes(block).decode(charset)).encode(charset)
+        except UnicodeError:
+            return block
+
+        if key is not None:
+            self.inline_cache.set(key, rewritten)
+        return rewritten
+
+    def _rewrite_inline(self, content, rewriter, charset=None):
+        """
+        Rewrite the class attributes and the inline blocks of the content,
+        bytes in the charset or text when charset is None. Return the
+        rewritten content and the number of class attributes.
+        """
+        attributes = 0
+
+        if charset is None:
+            (regex, start, end) = (self.inline_regex, 'class="', '"')
+            replace_names = rewriter.replace_names
+            subn_class_attributes = rewriter.subn_class_attributes
+        else:
+            (regex, start, end) = (self.inline_bytes_regex, b'class="', b'"')
+            replace_names = lambda names: rewriter.replace_names_bytes(names, charset)
+            subn_class_attributes = lambda tag: rewriter.subn_class_attributes_bytes(tag, charset)
+
+        def replace(match):
+            nonlocal attributes
+            if match.group(5) is not None:
+                attributes += 1
+                return start + replace_names(match.group(5)) + end
+
+            # The opening tag itself may have a class attribute.
+            (opening_tag, count) = subn_class_attributes(match.group(1))
+            attributes += count
+
+            tag = 'style' if match.group(2).lower() in ('style', b'style') else 'script'
+            return opening_tag + self._rewrite_inline_block(tag, match.group(3), rewriter, charset) + match.group(4)
+
+        return regex.sub(replace, content), attributes
+
+    def _rewrite_content(self, content, rewriter):
+        """
+        Return the rewritten content and the number of class attributes.
+        """
+        if self.inline_regex is not None:
+            return self._rewrite_inline(content, rewriter)
+
+        return rewriter.subn_class_attributes(content)
+
+    def _has_class_names(self, content):
+        if b'class' in content:
+            return True
+        # The inline blocks are matched whatever the case of their tags.
+        return self.inline_start_bytes_regex is not None and self.inline_start_bytes_regex.search(content) is not None
+
+    def _rewrite_bytes(self, content, rewriter, charset):
+        """
+        Return the rewritten content and the number of class attributes. The
+        bytes are rewritten as they are, and returned as is when they hold
+        nothing to rewrite.
+        """
+        if not is_ascii_compatible(charset):
             try:
-                with open(self.json_file_name) as f:
-                    self.data = json.load(f)
-            except:
-                raise FileNotFoundError(
-                    errno.ENOENT, os.strerror(errno.ENOENT), self.json_file_name + '. Please run python manage.py collectstatic_compress to create {filename} file'.format(filename=self.json_file_name))
+                text = bytes(content).decode(charset)
+            except UnicodeError:
+                return content, 0
+            (rewritten, attributes) = self._rewrite_content(text, rewriter)
+            return rewritten.encode(charset), attributes
+
+        if not self._has_class_names(content):
+            return content, 0
+
+        if self.inline_bytes_regex is not None:
+            return self._rewrite_inline(content, rewriter, charset)
+
+        return rewriter.subn_class_attributes_bytes(content, charset)
+
+    def _rewrite_body(self, content, rewriter, charset):
+        """
+        Return the rewritten body and the number of class attributes, None
+        when the body comes from the cache.
+        """
+        if self.cache is None or (is_ascii_compatible(charset) and not self._has_class_names(content)):
+            return self._rewrite_bytes(content, rewriter, charset)
+
+        key = self.cache.make_key(content, '{version}:{charset}'.format(version=rewriter.version, charset=charset))
+        rewritten = self.cache.get(key)
+        if rewritten is not None:
+            return rewritten, None
+
+        (rewritten, attributes) = self._rewrite_bytes(content, rewriter, charset)
+        self.cache.set(key, rewritten)
+
+        return rewritten, attributes
+
+    def _rewrite_body_measured(self, request, content, rewriter, charset):
+        if self.metrics is None:
+            return self._rewrite_body(content, rewriter, charset)[0]
+
+        if not self.metrics.should_sample():
+            (rewritten, attributes) = self._rewrite_body(content, rewriter, charset)
+        else:
+            start = time.perf_counter()
+            (rewritten, attributes) = self._rewrite_body(content, rewriter, charset)
+            self.metrics.observe(time.perf_counter() - start, len(content), len(rewritten),
+                                 attributes, cached=attributes is None, path=request.path)
+
+        if attributes is None:
+            self.metrics.rewritten('cached')
+        elif rewritten is content:
+            self.metrics.rewritten('untouched')
+        else:
+            self.metrics.rewritten('rewritten')
+        return rewritten
+
+    def _skip(self, request, response, reason):
+        if self.metrics is not None:
+            self.metrics.skipped(reason, request.path)
+        return response
+
+    def _split_streaming_text(self, text):
+        # Only the text up to the last closed tag is safe to rewrite, the rest
+        # may be a tag which continues in the next chunk. The text is bytes
+        # in an ASCII compatible charset.
+        cut = text.rfind('>' if isinstance(text, str) else b'>') + 1
+
+        # An inline block is only rewritten once its closing tag is complete.
+        lowered = text.lower() if self.inline_tags else text
+        for tag in self.inline_tags:
+            (block_start, block_end) = ('<' + tag, '</' + tag)
+            if not isinstance(text, str):
+                (block_start, block_end) = (block_start.encode(), block_end.encode())
+
+            start = lowered.rfind(block_start)
+            if start == -1:
+                continue
+            end = lowered.find(block_end, start)
+            if end == -1 or end >= cut:
+                cut = min(cut, start)
+
+        # Never hold back more than the buffer size, to keep memory constant.
+        if len(text) - cut > self.streaming_buffer_size:
+            cut = len(text)
+
+        return text[:cut], text[cut:]
+
+    def _rewrite_streaming_content(self, streaming_content, rewriter, charset):
+        stream = StreamingRewrite(self, rewriter, charset)
+
+        for chunk in streaming_content:
+            rewritten = stream.feed(chunk)
+            if rewritten:
+                yield rewritten
+
+        rewritten = stream.close()
+        if rewritten:
+            yield rewritten
+
+    async def _arewrite_streaming_content(self, streaming_content, rewriter, charset):
+        stream = StreamingRewrite(self, rewriter, charset)
+
+        async for chunk in streaming_content:
+            rewritten = stream.feed(chunk)
+            if rewritten:
+                yield rewritten
+
+        rewritten = stream.close()
+        if rewritten:
+            yield rewritten
+
+    def _skip_reason(self, request):
+        if not self.should_minify:
+            return 'disabled'
+        if request.get_full_path().startswith('/admin'):
+            return 'admin'
+        if request.get_full_path() in self.not_allowed_url_minification:
+            return 'excluded_url'
+        if request.path.endswith('js') or request.path.endswith('json') or request.path.endswith('css'):
+            return 'static_path'
+        return None
+
+    def _response_charset(self, response):
+        try:
+            return codecs.lookup(response.charset).name
+        except LookupError:
+            return None
+
+    def _response_skip_reason(self, response):
+        # A compressed body can't be rewritten, and would be corrupted.
+        if response.has_header('Content-Encoding'):
+            return 'encoded'
+        # Like the streaming responses, only HTML is rewritten, the bytes of an
+        # image or the strings of a JSON body are left alone.
+        if not response.streaming and not response.get('Content-Type', '').startswith('text/html'):
+            return 'not_html'
+        if self._response_charset(response) is None:
+            return 'unknown_charset'
+        return None
+
+    def _rewrite_streaming_response(self, request, response, rewriter):
+        if not self.streaming:
+            return self._skip(request, response, 'streaming_disabled')
+        if not response.get('Content-Type', '').startswith('text/html'):
+            return self._skip(request, response, 'streaming_not_html')
+
+        charset = self._response_charset(response)
+        if getattr(response, 'is_async', False):
+            response.streaming_content = self._arewrite_streaming_content(
+                response.streaming_content, rewriter, charset)
+        else:
+            response.streaming_content = self._rewrite_streaming_content(
+                response.streaming_content, rewriter, charset)
+        if response.has_header('Content-Length'):
+            del response['Content-Length']
+        if self.metrics is not None:
+            self.metrics.rewritten('streaming')
+        return response
+
+    def _rewrite_response(self, request, response, rewriter):
+        """
+        Rewrite the body in place, so the status, headers and cookies of the
+        response are kept, set its ETag and answer If-None-Match with a 304.
+        """
+        negotiated = self._negotiate_encoding(request, response)
+        (encoding, compressor) = negotiated or (None, None)
+
+        etag = None
+        if self.etag == 'derived' and response.has_header('ETag'):
+            etag = self._derived_etag(response['ETag'], rewriter)
+
+            # The ETag is known before the rewrite, which is skipped for a 304.
+            response['ETag'] = self._encoded_etag(etag, encoding)
+            not_modified = self._not_modified(request, response)
+            if not_modified is not None:
+                return not_modified
+
+        original = response.content
+        content = self._rewrite_body_measured(request, original, rewriter, self._response_charset(response))
+        if content is not original:
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        if etag is None and self.etag:
+            etag = '"{digest}"'.format(digest=hashlib.blake2b(content, digest_size=16).hexdigest())
+
+            response['ETag'] = self._encoded_etag(etag, encoding)
+            not_modified = self._not_modified(request, response)
+            if not_modified is not None:
+                return not_modified
+        elif etag is None and response.has_header('ETag'):
+            # The ETag of the view doesn't match the rewritten body.
+            del response['ETag']
+
+        if encoding is not None and not self._compress_response(response, encoding, compressor):
+            if etag is not None:
+                response['ETag'] = etag
+
+        return response
 
     def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
         response = self.get_response(request)
 
-        def process_request(self, request):
-            pass
+        reason = self._skip_reason(request) or self._response_skip_reason(response)
+        if reason is not None:
+            return self._skip(request, response, reason)
 
-        if not request.get_full_path().startswith('/admin') and not request.get_full_path() in self.not_allowed_url_minification and self.should_minify:
-            
-            if request.path.endswith('js') or request.path.endswith('json') or request.path.endswith('css'):
-                return response
+        # The same class map for the whole response, even if it's reloaded meanwhile.
+        rewriter = self.class_map.get()
 
-            content = response.content.decode('utf-8')
+        if response.streaming:
+            return self._rewrite_streaming_response(request, response, rewriter)
 
-            class_regex = re.compile(r'class[ \t]*=[ \t]*"[^"]+"')
-            all_class_attributes = class_regex.findall(content)
+        return self._rewrite_response(request, response, rewriter)
 
-            if self.inline_style:
-                style_regex = re.compile(r'<style(.*?)</style>')
-                all_inline_styles = style_regex.findall(content)
+    async def __acall__(self, request):
+        response = await self.get_response(request)
 
-                for inline_style in all_inline_styles:
-                    original_style = inline_style
+        reason = self._skip_reason(request) or self._response_skip_reason(response)
+        if reason is not None:
+            return self._skip(request, response, reason)
 
-                    for (key, value) in self.data.items():
-                        inline_style = re.sub(r'\.{key}'.format(
-                            key=re.escape(key)), '.{value}'.format(value=value), inline_style)
+        rewriter = self.class_map.get()
 
-                    content = re.sub(r'{key}'.format(
-                        key=re.escape(original_style)), inline_style, content)
+        if response.streaming:
+            return self._rewrite_streaming_response(request, response, rewriter)
 
-            for class_attribute in all_class_attributes:
-                minified_classes_in_attribute = [
-                    self.data[class_name] if class_name in self.data else class_name for class_name in class_attribute[7:-1].split()]
-                new_attribute = 'class="' + \
-                    ' '.join(minified_classes_in_attribute) + '"'
-                content = re.sub(class_attribute, new_attribute, content)
+        if len(response.content) < self.async_threshold:
+            return self._rewrite_response(request, response, rewriter)
 
-            new_response = HttpResponse(content.encode())
-            new_response['Content-Length'] = str(len(new_response.content))
-            return new_response
+        # Large bodies are rewritten in the thread pool, so the event loop
+        # keeps serving the other requests meanwhile.
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), self._rewrite_response, request, response, rewriter)
 
-        return response
+    def _get_executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.async_threads, thread_name_prefix='minify_class')
+        return self.executor
+
+
+class StreamingRewrite:
+    """
+    Rewrites the chunks of a streaming response as they come, holding back
+    the end of a chunk which may be an unfinished tag.
+
+    The chunks are rewritten as bytes, only the charsets which aren't ASCII
+    compatible are decoded and encoded again.
+    """
+
+    def __init__(self, middleware, rewriter, charset):
+        self.middleware = middleware
+        self.rewriter = rewriter
+        self.charset = charset
+
+        if is_ascii_compatible(charset):
+            self.decoder = self.encoder = None
+            self.pending = b''
+        else:
+            self.decoder = codecs.getincrementaldecoder(charset)()
+            self.encoder = codecs.getincrementalencoder(charset)()
+            self.pending = ''
+
+    def _rewrite(self, content):
+        if self.decoder is None:
+            return self.middleware._rewrite_bytes(content, self.rewriter, self.charset)[0]
+        return self.encoder.encode(self.middleware._rewrite_content(content, self.rewriter)[0])
+
+    def feed(self, chunk):
+        if self.decoder is not None:
+            chunk = self.decoder.decode(chunk)
+
+        (complete, self.pending) = self.middleware._split_streaming_text(self.pending + chunk)
+        if not complete:
+            return b''
+        return self._rewrite(complete)
+
+    def close(self):
+        pending = self.pending
+        if self.decoder is not None:
+            pending += self.decoder.decode(b'', final=True)
+
+        rewritten = self._rewrite(pending) if pending else b''
+        if self.encoder is not None:
+            rewritten += self.encoder.encode('', final=True)
+        return rewritten
+
+
+class CompressedStaticFilesMiddleware:
+    """
+    Serves the precompressed .dcz, .br, .zst and .gz static files, for deployments
+    without a web server in front of Django. Add it at the top of MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+
+        self.get_response = get_response
+        self.static_prefix = urlparse(settings.STATIC_URL).path
+        self.index = CompressedFilesIndex(staticfiles_storage)
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.static_prefix):
+            response = serve_compressed(
+                request, self.index, request.path[len(self.static_prefix):])
+            if response is not None:
+                return response
+
+        return self.get_response(request)
@@ -1,19 +1,25 @@
 import codecs
 import json
 from string import ascii_lowercase
-import itertools
 import string
-import re
 import os
 from os.path import getatime, getctime, getmtime
 import errno
+import hashlib
+import tempfile
+import time
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 from django.core.exceptions import ImproperlyConfigured
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
 from django.contrib.staticfiles.storage import StaticFilesStorage
 
 from static_compressor import compressors
+from static_compressor.cache import CompressionCache, file_digest
+from static_compressor.dictionary import DictionaryCompressor
+from static_compressor.rewriter import ClassRewriter
+from static_compressor.stats import BuildStats
 
 from yaspin import yaspin
 
@@ -25,16 +31,74 @@ METHOD_MAPPING = {
     "gz": compressors.ZopfliCompressor,
     "br": compressors.BrotliCompressor,
     "gz+zlib": compressors.ZlibCompressor,
+    "zst": compressors.ZstdCompressor,
     # gz+zlib and gz cannot be used at the same time, because they produce the same file extension.
 }
 
 
+def compress_file(compressor, path, full_path, cache=None):
+    # Runs in the worker processes of the parallel compression, so it only
+    # gets picklable arguments. The output is streamed into a temporary file
+    # next to the source, which the storage then moves into place. Returns
+    # the temporary file and the time spent on it.
+    start = time.perf_counter()
+    (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(full_path), suffix='.tmp')
+
+    try:
+        cached = False
+        with os.fdopen(fd, 'wb') as output:
+            if cache is not None:
+                key = cache.make_key(file_digest(full_path, hashlib.sha256()), compressor)
+                cached = cache.get(key, output)
+
+            if not cached:
+                with open(full_path, 'rb') as file:
+                    compressor.compress_to(file, output)
+
+        if cache is not None and not cached:
+            cache.set(key, temp_path)
+
+        # mkstemp creates the file readable by its owner only, the storage
+        # moves it into place as is when FILE_UPLOAD_PERMISSIONS is None.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    return temp_path, time.perf_counter() - start
+
+
+def compress_with_dictionary(compressor, dest_path, full_path):
+    # Runs in the worker processes like compress_file, the compressor is
+    # pickled with its dictionary. Returns the compressed content and its
+    # report.
+    with open(full_path, 'rb') as f:
+        content = f.read()
+    compressed = compressor.compress(content)
+    return compressed, compressor.report(dest_path, content, compressed)
+
+
+class TemporaryCompressedFile(File):
+    """
+    Compressed file which FileSystemStorage moves instead of copying.
+    """
+
+    def __init__(self, path):
+        super().__init__(open(path, 'rb'), path)
+
+    def temporary_file_path(self):
+        return self.name
+
+
 class CompressMixin:
     allowed_extensions = []
     compress_methods = []
     keep_original = True
     compressors = []
     minimum_kb = 0
+    jobs = 1
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -49,6 +113,22 @@ class CompressMixin:
         self.keep_original = getattr(
             settings, "STATIC_COMPRESS_KEEP_ORIGINAL", True)
         self.minimum_kb = getattr(settings, "STATIC_COMPRESS_MIN_SIZE_KB", 30)
+        self.jobs = getattr(settings, "STATIC_COMPRESS_JOBS", 1)
+
+        self.use_dictionary = getattr(settings, "STATIC_COMPRESS_DICTIONARY", False)
+        self.dictionary_name = getattr(
+            settings, "STATIC_COMPRESS_DICTIONARY_NAME", 'static_compressor/dictionary')
+        self.dictionary_size_kb = getattr(settings, "STATIC_COMPRESS_DICTIONARY_SIZE_KB", 112)
+        self.dictionary_max_file_kb = getattr(settings, "STATIC_COMPRESS_DICTIONARY_MAX_FILE_KB", 64)
+        self.dictionary_level = getattr(settings, "STATIC_COMPRESS_DICTIONARY_LEVEL", 19)
+        self.dictionary_report = list()
+
+        self.compression_cache = None
+        compression_cache_dir = getattr(settings, "STATIC_COMPRESS_CACHE_DIR", None)
+        if compression_cache_dir is not None:
+            self.compression_cache = CompressionCache(
+                compression_cache_dir,
+                getattr(settings, "STATIC_COMPRESS_CACHE_MAX_SIZE_MB", 1024) * 1024 * 1024)
         self.static_root = getattr(
             settings, "STATIC_ROOT", ".")
 
@@ -80,8 +160,6 @@ class CompressMixin:
         self.json_file_name = getattr(
             settings, "STATIC_CLASSES_FILE_NAME", 'data.json')
 
-        self.css_quoted_salt = '1234567890!@#$%^&*-+_|abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
-
         valid = [i for i in self.compress_methods if i in METHOD_MAPPING]
         if not valid:
             raise ImproperlyConfigured(
@@ -89,7 +167,8 @@ class CompressMixin:
         if "gz" in valid and "gz+zlib" in valid:
             raise ImproperlyConfigured(
                 "STATIC_COMPRESS_METHODS: gz and gz+zlib cannot be used at the same time.")
-        self.compressors = [METHOD_MAPPING[k]() for k in valid]
+        method_options = getattr(settings, "STATIC_COMPRESS_METHOD_OPTIONS", dict())
+        self.compressors = [METHOD_MAPPING[k](**method_options.get(k, dict())) for k in valid]
 
     def get_alternate_compressed_path(self, name):
         for compressor in self.compressors:
@@ -102,6 +181,15 @@ class CompressMixin:
                 return path
         raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
 
+    def get_compressed_variants(self, name):
+        variants = dict()
+        extensions = [compressor.extension for compressor in self.compressors]
+        for extension in extensions + [DictionaryCompressor.extension]:
+            path = self.path("{}.{}".format(name, extension))
+            if os.path.exists(path):
+                variants[extension] = path
+        return variants
+
     def get_accessed_time(self, name):
         if self.keep_original:
             return super().get_accessed_time(name)
@@ -118,37 +206,6 @@ class CompressMixin:
         alt = self.get_alternate_compressed_path(name)
         return self._datetime_from_timestamp(getmtime(alt))
 
-    def create_dictionary_of_selectors(self, selector_collection):
-        dictionary = dict()
-
-        for instance in selector_collection:
-            x = instance
-
-            for (key, value) in self.data.items():
-                instance = re.sub(r'\.{key}'.format(
-                    key=re.escape(key)), '.{value}'.format(value=re.escape(value)), instance)
-                dictionary[x] = instance
-
-        return dictionary
-
-    def create_dictionary_of_non_dot_selector(self, selector_collection):
-        dictionary = dict()
-
-        for instance in selector_collection:
-            x = instance
-
-            for (key, value) in self.data.items():
-                instance = re.sub(r'{key}'.format(
-                    key=re.escape(key)), '{value}'.format(value=re.escape(value)), instance)
-                dictionary[x] = instance
-
-        return dictionary
-
-    def iter_all_strings(self):
-        for size in itertools.count(start=1):
-            for s in itertools.product(self.css_quoted_salt, repeat=size):
-                yield "".join(s)
-
     def _minify(self, file, destination, original_file):
         if destination.endswith('.css') or original_file.endswith('.css') and original_file not in self.exclude_css_files:
             read_css_file = file.read().decode('utf-8')
@@ -158,37 +215,7 @@ class CompressMixin:
                 self.delete(destination)
                 self.delete(original_file)
 
-            # To remove stream of comments
-            read_css_file = re.sub(re.compile(
-                "/\*.*?\*/", re.DOTALL), '', read_css_file)
-
-            quoted = dict()
-
-            quotes_regex = re.compile(
-                r'[\'\"].*?[\'\"]')
-            quoted_texts = quotes_regex.findall(
-                read_css_file)
-
-            for instance in quoted_texts:
-                if not instance in quoted:
-                    quoted[instance] = 0
-                quoted[instance] += 1
-
-            for (generated_code_word, key) in zip(itertools.islice(self.iter_all_strings(), len(quoted)), quoted.keys()):
-                quoted[key] = generated_code_word
-                read_css_file = re.sub(r'{sentence}'.format(
-                    sentence=key), '"' + generated_code_word + '"', read_css_file)
-
-            sorted_quoted = OrderedDict(
-                sorted(quoted.items(), key=lambda x: len(x[0]), reverse=True))
-
-            for (key, value) in self.data.items():
-                read_css_file = re.sub(r'\.{key}'.format(
-                    key=re.escape(key)), '.{value}'.format(value=re.escape(value)), read_css_file)
-
-            for (key, value) in sorted_quoted.items():
-                read_css_file = re.sub(r'[\'\"]{value}[\'\"]'.format(
-                    value=re.escape(value)), '{key}'.format(key=key), read_css_file)
+            read_css_file = self.rewriter.replace_stylesheet(read_css_file)
 
             content_file = ContentFile(read_css_file.encode())
             self._save(original_file, content_file)
@@ -203,90 +230,7 @@ class CompressMixin:
                 self.delete(destination)
                 self.delete(original_file)
 
-            html_class_regex = re.compile(r'class[ \t]*=[ \t]*"[^"]+"')
-            all_class_attributes = html_class_regex.findall(
-                read_js_file)
-
-            for class_attribute in all_class_attributes:
-                minified_classes_in_attribute = [
-                    self.data[class_name] if class_name in self.data else class_name for class_name in class_attribute[7:-1].split()]
-                new_attribute = 'class="' + \
-                    ' '.join(minified_classes_in_attribute) + '"'
-                read_js_file = re.sub(
-                    class_attribute, new_attribute, read_js_file)
-
-            get_selector_regex = re.compile(
-                r'querySelector\([\'\"][^\'\"]*?\.[^\'\"]*?[\'\"]\)')
-
-            selector_collection = get_selector_regex.findall(
-                read_js_file)
-
-            querySelector = self.create_dictionary_of_selectors(selector_collection)
-
-            for (key, value) in querySelector.items():
-                read_js_file = re.sub(
-                    re.escape(key), value, read_js_file)
-
-            get_selector_all_regex = re.compile(
-                r'querySelectorAll\([\'\"][^\'\"]*?\.[^\'\"]*?[\'\"]\)')
-            selector_all_collection = get_selector_all_regex.findall(
-                read_js_file)
-
-            querySelector_all = self.create_dictionary_of_selectors(selector_all_collection)
-
-            for (key, value) in querySelector_all.items():
-                read_js_file = re.sub(
-                    re.escape(key), value, read_js_file)
-
-            get_element_by_classname_regex = re.compile(
-                r'getElementsByClassName\([\'\"][^\'\"]*?[^\'\"]*?[\'\"]\)')
-            class_collection = get_element_by_classname_regex.findall(
-                read_js_file)
-
-            get_elements_by_classes = self.create_dictionary_of_non_dot_selector(class_collection)
-
-            for (key, value) in get_elements_by_classes.items():
-                read_js_file = re.sub(
-                    re.escape(key), value, read_js_file)
-
-            class_list_add_elements_regex = re.compile(
-                r'classList.add\([\'\"][^\'\"]*?[^\'\"]*?[\'\"]\)')
-            class_list_contains_elements_regex = re.compile(
-                r'classList.contains\([\'\"][^\'\"]*?[^\'\"]*?[\'\"]\)')
-            class_list_remove_elements_regex = re.compile(
-                r'classList.remove\([\'\"][^\'\"]*?[^\'\"]*?[\'\"]\)')
-            class_list_toggle_elements_regex = re.compile(
-                r'classList.toggle\([\'\"][^\'\"]*?[^\'\"]*?[\'\"]\)')
-
-            class_list_add_collection = class_list_add_elements_regex.findall(
-                read_js_file)
-            class_list_remove_collection = class_list_remove_elements_regex.findall(
-                read_js_file)
-            class_list_contains_collection = class_list_contains_elements_regex.findall(
-                read_js_file)
-            class_list_toggle_collection = class_list_toggle_elements_regex.findall(
-                read_js_file)
-
-            classlist_add = self.create_dictionary_of_non_dot_selector(class_list_add_collection)
-            classlist_remove = self.create_dictionary_of_non_dot_selector(class_list_remove_collection)
-            classlist_contains = self.create_dictionary_of_non_dot_selector(class_list_contains_collection)
-            classlist_toggle = self.create_dictionary_of_non_dot_selector(class_list_toggle_collection)
-
-            for (key, value) in classlist_add.items():
-                read_js_file = re.sub(
-                    re.escape(key), value, read_js_file)
-
-            for (key, value) in classlist_remove.items():
-                read_js_file = re.sub(
-                    re.escape(key), value, read_js_file)
-
-            for (key, value) in classlist_contains.items():
-                read_js_file = re.sub(
-                    re.escape(key), value, read_js_file)
-
-            for (key, value) in classlist_toggle.items():
-                read_js_file = re.sub(
-                    re.escape(key), value, read_js_file)
+            read_js_file = self.rewriter.replace_script(read_js_file)
 
             content_file = ContentFile(read_js_file.encode())
             self._save(original_file, content_file)
@@ -302,23 +246,10 @@ class CompressMixin:
                 self.delete(destination)
                 self.delete(original_file)
 
-            regex = re.compile(r'class[ \t]*=[ \t]*"[^"]+"')
-
-            all_class_attributes = regex.findall(read_svg_file)
+            read_svg_file = self.rewriter.replace_class_attributes(read_svg_file)
 
-            for class_attribute in all_class_attributes:
-                minified_classes_in_attribute = [
-                    self.data[class_name] if class_name in self.data else class_name for class_name in class_attribute[7:-1].split()]
-                new_attribute = 'class="' + \
-                    ' '.join(minified_classes_in_attribute) + '"'
-                read_svg_file = re.sub(
-                    class_attribute, new_attribute, read_svg_file)
+            read_svg_file = self.rewriter.replace_selectors(read_svg_file)
 
-            
-            for (key, value) in self.data.items():
-                read_svg_file = re.sub(r'\.{key}'.format(
-                    key=re.escape(key)), '.{value}'.format(value=re.escape(value)), read_svg_file)
-            
             content_file = ContentFile(read_svg_file.encode())
             self._save(original_file, content_file)
             new_file = self._save(destination, content_file)
@@ -327,80 +258,186 @@ class CompressMixin:
         else:
             return destination
 
-    def post_process(self, paths, dry_run=False, **options):
-       
+    def post_process(self, paths, dry_run=False, jobs=None, dictionary=None, stats=None, **options):
+
         if hasattr(super(), "post_process"):
             yield from super().post_process(paths, dry_run, **options)
 
         if dry_run:
             return
 
+        if jobs is None:
+            jobs = self.jobs
+
+        if dictionary is None:
+            dictionary = self.use_dictionary
+
+        if stats is None:
+            stats = BuildStats()
+
         with yaspin(text="Collecting all static files", color="cyan") as sp:
 
             all_directories = set()
-        
-            with open(self.json_file_name) as f:
+            tasks = list()
+            dictionary_files = list()
+
+            with stats.phase('load'), open(self.json_file_name) as f:
                 self.data = json.load(f, object_pairs_hook=OrderedDict)
+                self.rewriter = ClassRewriter(self.data)
+
+            for name in paths.keys():
+
+                source_storage, path = paths[name]
+
+                dest_path = self._get_dest_path(path)
+                with self._open(dest_path) as file:
+                    new_path = dest_path
+                    current_directory = path.split('\\')[0]
+
+                    if current_directory != 'admin' and current_directory not in self.exclude_static_directory:
+                        size = os.path.getsize(self.path(dest_path))
+                        start = time.perf_counter()
 
-                for name in paths.keys():
-
-                    source_storage, path = paths[name]
-                    
-                    dest_path = self._get_dest_path(path)
-                    with self._open(dest_path) as file:
-                        new_file = file
-                        current_directory = path.split('\\')[0]
-                    
-                        if current_directory != 'admin' and current_directory not in self.exclude_static_directory:
-                            
+                        with stats.phase('minify'):
                             new_path = self._minify(file, dest_path, name)
-                            new_file = self._open(new_path)
-
-                        if current_directory not in all_directories:
-                            sp.write('> {directory_name} is compressing...'.format(
-                                directory_name=current_directory))
-                            all_directories.add(current_directory)
-
-                        if not self._is_file_allowed(name):
-                            continue
-
-                        # Process if file is big enough
-                        if os.path.getsize(self.path(path)) < self.minimum_kb * 1024:
-                            continue
-
-                        src_mtime = source_storage.get_modified_time(path)
-                        for compressor in self.compressors:
-                            dest_compressor_path = "{}.{}".format(
-                                dest_path, compressor.extension)
-                            # Check if the original file has been changed.
-                            # If not, no need to compress again.
-                            full_compressed_path = self.path(dest_compressor_path)
-                            try:
-                                dest_mtime = self._datetime_from_timestamp(
-                                    getmtime(full_compressed_path))
-                                file_is_unmodified = dest_mtime.replace(
-                                    microsecond=0) >= src_mtime.replace(microsecond=0)
-                            except FileNotFoundError:
-                                file_is_unmodified = False
-                            if file_is_unmodified:
-                                continue
-
-                            # Delete old gzip file, or Nginx will pick the old file to serve.
-                            # Note: Django won't overwrite the file, so we have to delete it ourselves.
-                            if self.exists(dest_compressor_path):
-                                self.delete(dest_compressor_path)
-                            out = compressor.compress(path, new_file)
-
-                            if out:
-                                self._save(dest_compressor_path, out)
-                                if not self.keep_original:
-                                    self.delete(name)
-                                yield dest_path, dest_compressor_path, True
-
-                            new_file.seek(0)
+
+                        stats.record_file('minify', dest_path, time.perf_counter() - start,
+                                          size, os.path.getsize(self.path(new_path)))
+
+                if current_directory not in all_directories:
+                    sp.write('> {directory_name} is compressing...'.format(
+                        directory_name=current_directory))
+                    all_directories.add(current_directory)
+
+                if not self._is_file_allowed(name):
+                    continue
+
+                if dictionary and os.path.getsize(self.path(new_path)) <= self.dictionary_max_file_kb * 1024:
+                    dictionary_files.append((dest_path, self.path(new_path)))
+
+                # Process if file is big enough
+                if os.path.getsize(self.path(path)) < self.minimum_kb * 1024:
+                    continue
+
+                src_mtime = source_storage.get_modified_time(path)
+                for compressor in self.compressors:
+                    dest_compressor_path = "{}.{}".format(
+                        dest_path, compressor.extension)
+                    # Check if the original file has been changed.
+                    # If not, no need to compress again.
+                    full_compressed_path = self.path(dest_compressor_path)
+                    try:
+                        dest_mtime = self._datetime_from_timestamp(
+                            getmtime(full_compressed_path))
+                        file_is_unmodified = dest_mtime.replace(
+                            microsecond=0) >= src_mtime.replace(microsecond=0)
+                    except FileNotFoundError:
+                        file_is_unmodified = False
+                    if file_is_unmodified:
+                        continue
+
+                    # Delete old gzip file, or Nginx will pick the old file to serve.
+                    # Note: Django won't overwrite the file, so we have to delete it ourselves.
+                    if self.exists(dest_compressor_path):
+                        self.delete(dest_compressor_path)
+
+                    tasks.append(
+                        (name, dest_path, dest_compressor_path, compressor, path, self.path(new_path)))
+
+            # The dictionary and the other compressors share the worker
+            # processes, which are only started by the first task.
+            executor = None
+            if jobs != 1 and len(tasks) + len(dictionary_files) > 1:
+                executor = ProcessPoolExecutor(max_workers=jobs or None)
+
+            try:
+                # Done before the other compressors, which may delete the originals.
+                if dictionary:
+                    with stats.phase('dictionary'):
+                        yield from self._compress_with_dictionary(dictionary_files, stats, executor)
+
+                with stats.phase('compress'):
+                    yield from self._compress_files(tasks, executor, stats)
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+
+            if self.compression_cache is not None:
+                self.compression_cache.evict()
 
             sp.ok("✔")
 
+    def _compress_with_dictionary(self, dictionary_files, stats, executor=None):
+        self.dictionary_report = list()
+
+        contents = list()
+        for (dest_path, full_path) in dictionary_files:
+            with open(full_path, 'rb') as f:
+                contents.append(f.read())
+
+        compressor = DictionaryCompressor(self.dictionary_level)
+        if not compressor.train(contents, self.dictionary_size_kb * 1024):
+            return
+        # The workers read the files again, rather than getting them pickled.
+        # The dictionary is pickled once per chunk of 16 files.
+        del contents
+
+        dictionary_name = compressor.dictionary_name(self.dictionary_name)
+        if self.exists(dictionary_name):
+            self.delete(dictionary_name)
+        self._save(dictionary_name, ContentFile(compressor.content))
+        yield dictionary_name, dictionary_name, True
+
+        arguments = [[compressor] * len(dictionary_files)]
+        arguments += [[task[index] for task in dictionary_files] for index in (0, 1)]
+
+        for ((dest_path, full_path), (compressed, report)) in zip(
+                dictionary_files, self._map(executor, compress_with_dictionary, *arguments, chunksize=16)):
+            dest_compressor_path = "{}.{}".format(dest_path, compressor.extension)
+            if self.exists(dest_compressor_path):
+                self.delete(dest_compressor_path)
+
+            self._save(dest_compressor_path, ContentFile(compressed))
+            stats.add_bytes('dictionary', report['size'], len(compressed))
+            self.dictionary_report.append(report)
+            yield dest_path, dest_compressor_path, True
+
+    def _compress_files(self, tasks, executor, stats):
+        arguments = [[task[index] for task in tasks] for index in (3, 4, 5)]
+        arguments.append([self.compression_cache] * len(tasks))
+
+        yield from self._save_compressed_files(tasks, self._map(executor, compress_file, *arguments), stats)
+
+    def _map(self, executor, function, *arguments, chunksize=1):
+        if executor is None:
+            return map(function, *arguments)
+        # map() returns the results in the order of the tasks, so the files
+        # are saved and reported in the same order as serially.
+        return executor.map(function, *arguments, chunksize=chunksize)
+
+    def _save_compressed_files(self, tasks, results, stats):
+        compressed_names = list()
+
+        for (task, (temp_path, seconds)) in zip(tasks, results):
+            name, dest_path, dest_compressor_path = task[:3]
+            stats.record_file('compress', dest_path, seconds,
+                              os.path.getsize(task[5]), os.path.getsize(temp_path))
+
+            with TemporaryCompressedFile(temp_path) as out:
+                self._save(dest_compressor_path, out)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+            compressed_names.append(name)
+            yield dest_path, dest_compressor_path, True
+
+        # The originals are the input of the other compressors, so they are
+        # only deleted once every file has been compressed.
+        if not self.keep_original:
+            for name in compressed_names:
+                if self.exists(name):
+                    self.delete(name)
+
     def _get_dest_path(self, path):
         if hasattr(self, "hashed_name"):
             return self.hashed_name(path)
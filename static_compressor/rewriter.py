@@ -0,0 +1,331 @@
+import re
+import codecs
+import hashlib
+import errno
+import os
+import json
+from functools import lru_cache
+
+__all__ = ["ClassRewriter", "CLASS_ATTRIBUTE_REGEX", "CLASS_ATTRIBUTE_BYTES_REGEX", "EncodedClassMap",
+           "is_ascii_compatible", "load_class_map"]
+
+CLASS_ATTRIBUTE_REGEX = re.compile(r'class[ \t]*=[ \t]*"([^"]+)"')
+
+CLASS_ATTRIBUTE_BYTES_REGEX = re.compile(rb'class[ \t]*=[ \t]*"([^"]+)"')
+
+QUOTED_ARGUMENT_REGEX = re.compile(r'([\'\"])([^\'\"]*)([\'\"])')
+
+CSS_COMMENT_REGEX = re.compile(r'/\*.*?\*/', re.DOTALL)
+
+CSS_QUOTED_REGEX = re.compile(r'([\'\"].*?[\'\"])')
+
+# querySelector('.a .b') and querySelectorAll('.a .b') take selectors.
+JS_SELECTOR_CALL_REGEX = re.compile(r'querySelector(?:All)?\([\'\"][^\'\"]*?\.[^\'\"]*?[\'\"]\)')
+
+# getElementsByClassName('a b') and classList.add('a') take class names.
+JS_CLASS_NAME_CALL_REGEX = re.compile(
+    r'(?:getElementsByClassName|classList\.(?:add|contains|remove|toggle))\([\'\"][^\'\"]*?[\'\"]\)')
+
+# Encoded class names looked up at least once, per charset.
+ENCODED_MEMO_SIZE = 65536
+
+TEMPLATE_STYLE_REGEX = re.compile(r'(<style[^>]*>)(.*?)(</style>)', re.DOTALL | re.IGNORECASE)
+
+# Django and Jinja2 share the same delimiters for variables, tags and comments.
+TEMPLATE_TAG_REGEX = re.compile(r'({{.*?}}|{%.*?%}|{#.*?#})', re.DOTALL)
+
+
+def load_class_map(json_file_name):
+    try:
+        with open(json_file_name) as f:
+            return json.load(f)
+    except:
+        raise FileNotFoundError(
+            errno.ENOENT, os.strerror(errno.ENOENT), json_file_name + '. Please run python manage.py collectstatic_compress to create {filename} file'.format(filename=json_file_name))
+
+
+# UTF-8 and the single-byte charsets, where an ASCII byte is always the ASCII
+# character. Multi-byte charsets like Shift_JIS, Big5 or GBK can have ASCII
+# bytes inside a character, and ISO-2022 switches sets with escapes.
+ASCII_COMPATIBLE_CHARSETS = frozenset(
+    ['utf-8', 'ascii', 'koi8-r', 'koi8-u', 'mac-roman', 'cp437', 'cp850', 'cp866', 'cp874'] +
+    ['iso8859-{number}'.format(number=number) for number in range(1, 17) if number != 12] +
+    ['cp{number}'.format(number=number) for number in range(1250, 1259)])
+
+
+@lru_cache(maxsize=None)
+def is_ascii_compatible(encoding):
+    """
+    Whether the markup of a document in this charset can be matched byte by
+    byte, like in UTF-8 and Latin-1 but not in UTF-16 or Shift_JIS.
+    """
+    try:
+        return codecs.lookup(encoding).name in ASCII_COMPATIBLE_CHARSETS
+    except LookupError:
+        return False
+
+
+class EncodedClassMap(dict):
+    """
+    The class map with the class names encoded in a charset, for rewriting
+    bytes without decoding them.
+
+    The names are encoded on their first lookup, so the whole map is never
+    copied, and the unknown names map to themselves.
+    """
+
+    def __init__(self, data, encoding):
+        super().__init__()
+        self.data = data
+        self.encoding = encoding
+
+    def __missing__(self, name):
+        try:
+            value = self.data.get(name.decode(self.encoding))
+            value = name if value is None else value.encode(self.encoding)
+        except UnicodeError:
+            value = name
+
+        if len(self) >= ENCODED_MEMO_SIZE:
+            self.clear()
+        self[name] = value
+        return value
+
+
+def _build_trie(words):
+    trie = dict()
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, dict())
+        # An empty key marks the end of a complete word.
+        node[''] = True
+    return trie
+
+
+def _trie_to_pattern(node):
+    branches = [re.escape(char) + _trie_to_pattern(child)
+                for (char, child) in sorted(node.items()) if char != '']
+
+    if not branches:
+        return ''
+
+    if len(branches) == 1:
+        pattern = branches[0]
+    else:
+        pattern = '(?:' + '|'.join(branches) + ')'
+
+    # Optional groups are greedy, so the regex engine always tries the longer
+    # word first and only falls back to the shorter one when it fails.
+    if '' in node:
+        pattern = '(?:' + pattern + ')?'
+
+    return pattern
+
+
+class ClassRewriter:
+    """
+    Rewrites class names using the data.json map in a single pass.
+
+    The class names are compiled into one trie shaped regex, so a file is
+    scanned once no matter how many classes the map holds, and the longest
+    class name wins when several of them share a prefix.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+        # Identifies the class map, for caches of rewritten content. A
+        # MappedClassMap carries its version.
+        self.version = getattr(data, 'version', None) or hashlib.blake2b(json.dumps(
+            data, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+        self._selector_regex = None
+        self._encoded_names = dict()
+        self._selector_bytes_regexes = dict()
+
+    @property
+    def selector_regex(self):
+        # Compiled on first use, the processes which only rewrite class
+        # attributes never pay for it.
+        if self._selector_regex is None:
+            words = [key for key in self.data if key]
+            if words:
+                self._selector_regex = re.compile(
+                    r'\.(' + _trie_to_pattern(_build_trie(words)) + ')')
+        return self._selector_regex
+
+    def compile_selectors(self):
+        """
+        Compile the selector regex now rather than on its first use. It's
+        built from every key of the map, which takes about a second and a
+        few MB for tens of thousands of classes.
+        """
+        self.selector_regex
+        return self
+
+    def _replace_selector(self, match):
+        return '.' + self.data[match.group(1)]
+
+    def replace_selectors(self, text):
+        """
+        Replace every `.class` selector in the text with its short name.
+        """
+        regex = self.selector_regex
+        if regex is None:
+            return text
+        return regex.sub(self._replace_selector, text)
+
+    def encoded_names(self, encoding='utf-8'):
+        names = self._encoded_names.get(encoding)
+        if names is None:
+            names = self._encoded_names[encoding] = EncodedClassMap(self.data, encoding)
+        return names
+
+    def selector_bytes_regex(self, encoding='utf-8'):
+        if encoding in self._selector_bytes_regexes:
+            return self._selector_bytes_regexes[encoding]
+
+        # Every byte of the encoded names is a Latin-1 character in the trie,
+        # so the pattern encodes back to these exact bytes.
+        words = list()
+        for key in self.data:
+            if not key:
+                continue
+            try:
+                words.append(key.encode(encoding).decode('latin-1'))
+            except UnicodeError:
+                # The name can't be written in this charset.
+                pass
+
+        regex = None
+        if words:
+            regex = re.compile(rb'\.(' + _trie_to_pattern(_build_trie(words)).encode('latin-1') + rb')')
+        self._selector_bytes_regexes[encoding] = regex
+        return regex
+
+    def replace_selectors_bytes(self, content, encoding='utf-8'):
+        """
+        Same as replace_selectors, for content encoded in an ASCII compatible
+        charset.
+        """
+        regex = self.selector_bytes_regex(encoding)
+        if regex is None:
+            return content
+        names = self.encoded_names(encoding)
+        return regex.sub(lambda match: b'.' + names[match.group(1)], content)
+
+    def subn_class_attributes_bytes(self, content, encoding='utf-8'):
+        """
+        Same as subn_class_attributes, for content encoded in an ASCII
+        compatible charset. The content is returned as is when it has no
+        class attribute.
+        """
+        # The lookups of known names stay in C, only new ones call __missing__.
+        lookup = self.encoded_names(encoding).__getitem__
+        return CLASS_ATTRIBUTE_BYTES_REGEX.subn(
+            lambda match: b'class="' + b' '.join(map(lookup, match.group(1).split())) + b'"', content)
+
+    def replace_names_bytes(self, content, encoding='utf-8'):
+        """
+        Same as replace_names, for content encoded in an ASCII compatible
+        charset.
+        """
+        return b' '.join(map(self.encoded_names(encoding).__getitem__, content.split()))
+
+    def replace_stylesheet(self, text):
+        """
+        Replace the class selectors of a stylesheet, except in its quoted
+        strings like url("icon.btn.svg").
+
+        The comments are removed first, a quote in a comment would otherwise
+        protect the selectors which follow it.
+        """
+        parts = CSS_QUOTED_REGEX.split(CSS_COMMENT_REGEX.sub('', text))
+        # split() puts the quoted strings at the odd indexes.
+        parts[::2] = [self.replace_selectors(part) for part in parts[::2]]
+        return ''.join(parts)
+
+    def _replace_quoted_names(self, match):
+        return match.group(1) + self.replace_names(match.group(2)) + match.group(3)
+
+    def _replace_class_name_call(self, match):
+        return QUOTED_ARGUMENT_REGEX.sub(self._replace_quoted_names, match.group(0))
+
+    def replace_script(self, text):
+        """
+        Replace the class names of a script: in its class attributes, in the
+        selectors of querySelector and querySelectorAll, and in the names
+        given to getElementsByClassName and classList.
+        """
+        text = self.replace_class_attributes(text)
+        text = JS_SELECTOR_CALL_REGEX.sub(lambda match: self.replace_selectors(match.group(0)), text)
+        return JS_CLASS_NAME_CALL_REGEX.sub(self._replace_class_name_call, text)
+
+    def replace_names(self, text):
+        """
+        Replace every whitespace separated class name in the text.
+        """
+        return ' '.join(self.data.get(class_name, class_name) for class_name in text.split())
+
+    def _replace_class_attribute(self, match):
+        return 'class="' + self.replace_names(match.group(1)) + '"'
+
+    def replace_class_attributes(self, text):
+        """
+        Replace the class names of every `class="..."` attribute in the text.
+        """
+        return CLASS_ATTRIBUTE_REGEX.sub(self._replace_class_attribute, text)
+
+    def subn_class_attributes(self, text):
+        """
+        Same as replace_class_attributes, but like re.subn also return the
+        number of attributes.
+        """
+        return CLASS_ATTRIBUTE_REGEX.subn(self._replace_class_attribute, text)
+
+    def _replace_template_literal(self, text, after_tag, before_tag):
+        parts = re.split(r'(\s+)', text)
+
+        for index in range(0, len(parts), 2):
+            # A name glued to a template variable, like btn-{{ color }}, is
+            # only part of a class name and is left alone. The block tags and
+            # comments output no text, so btn{% if on %} is a whole name.
+            if index == 0 and after_tag:
+                continue
+            if index == len(parts) - 1 and before_tag:
+                continue
+            parts[index] = self.data.get(parts[index], parts[index])
+
+        return ''.join(parts)
+
+    def _replace_template_class_attribute(self, match):
+        pieces = TEMPLATE_TAG_REGEX.split(match.group(1))
+
+        # A quote inside a template tag ends the match early, for example
+        # class="{% if a == "b" %}...", then the attribute is not rewritten.
+        for piece in pieces[::2]:
+            if '{{' in piece or '{%' in piece or '{#' in piece:
+                return match.group(0)
+
+        # split() puts the template tags at the odd indexes.
+        for index in range(0, len(pieces), 2):
+            pieces[index] = self._replace_template_literal(
+                pieces[index],
+                index > 0 and pieces[index - 1].startswith('{{'),
+                index < len(pieces) - 1 and pieces[index + 1].startswith('{{'))
+
+        return 'class="' + ''.join(pieces) + '"'
+
+    def _replace_template_style(self, match):
+        return match.group(1) + self.replace_selectors(match.group(2)) + match.group(3)
+
+    def replace_template_source(self, text):
+        """
+        Replace the literal class names of a Django or Jinja2 template source.
+
+        Only the static text of class attributes and inline <style> blocks is
+        rewritten, template tags are kept untouched.
+        """
+        text = TEMPLATE_STYLE_REGEX.sub(self._replace_template_style, text)
+        return CLASS_ATTRIBUTE_REGEX.sub(self._replace_template_class_attribute, text)
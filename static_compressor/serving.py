@@ -0,0 +1,181 @@
+import base64
+import mimetypes
+import os
+import re
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from static_compressor.dictionary import DictionaryCompressor, read_dictionary_digest
+
+__all__ = ["CompressedFilesIndex", "serve_compressed"]
+
+# Content-Encoding and file extension, by order of preference.
+ENCODINGS = [("br", "br"), ("zstd", "zst"), ("gzip", "gz")]
+
+# ManifestStaticFilesStorage adds the first 12 characters of the md5 hash.
+HASHED_NAME_REGEX = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+DICTIONARY_ENCODING = DictionaryCompressor.extension
+
+
+def parse_accept_encoding(header):
+    accepted = set()
+    for item in header.split(','):
+        (encoding, _, params) = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(encoding.strip().lower())
+    return accepted
+
+
+def parse_available_dictionary(header):
+    # The SHA-256 of the dictionary, as a structured field byte sequence.
+    header = header.strip()
+    if len(header) < 2 or not header.startswith(':') or not header.endswith(':'):
+        return None
+    try:
+        return base64.b64decode(header[1:-1], validate=True)
+    except ValueError:
+        return None
+
+
+class CompressedFilesIndex:
+    """
+    In-memory index of the collected static files and their precompressed
+    variants, built once by walking STATIC_ROOT.
+
+    The variants are the files the storage compressed, indexed by the name
+    of their original, which is deleted with STATIC_COMPRESS_KEEP_ORIGINAL =
+    False. The originals, and any other file like archive.tar.gz, are served
+    as is under their own name.
+
+    The .dcz variants compressed against the shared dictionary are only sent
+    to the clients which announce that dictionary in Available-Dictionary.
+    """
+
+    def __init__(self, storage):
+        if not hasattr(storage, 'get_compressed_variants'):
+            raise ImproperlyConfigured(
+                "Serving precompressed static files requires a STATICFILES_STORAGE using CompressMixin.")
+
+        encodings = dict((extension, encoding) for (encoding, extension) in ENCODINGS)
+        names = set()
+
+        for (root, dirs, files) in os.walk(storage.location):
+            for file in files:
+                # The temporary files of compress_file, left by a killed worker.
+                if not file.endswith('.tmp'):
+                    names.add(os.path.relpath(os.path.join(root, file), storage.location).replace(os.sep, '/'))
+
+        originals = set()
+        for name in names:
+            (original_name, extension) = os.path.splitext(name)
+            if ((extension[1:] in encodings or extension[1:] == DICTIONARY_ENCODING)
+                    and storage._is_file_allowed(original_name)
+                    and (original_name in names or not storage.keep_original)):
+                originals.add(original_name)
+
+        self.files = dict()
+        self.dictionary_digests = dict()
+        variant_names = set()
+
+        for original_name in originals:
+            for (extension, path) in storage.get_compressed_variants(original_name).items():
+                if extension == DICTIONARY_ENCODING:
+                    digest = read_dictionary_digest(path)
+                    if digest is None:
+                        continue
+                    self.dictionary_digests[original_name] = digest
+                    encoding = DICTIONARY_ENCODING
+                else:
+                    encoding = encodings[extension]
+                self._add(original_name, encoding, path)
+                variant_names.add('{name}.{extension}'.format(name=original_name, extension=extension))
+
+        # The trained dictionaries, sent with Use-As-Dictionary.
+        self.dictionaries = set(name for name in names
+                                if name.startswith(storage.dictionary_name + '.') and name.endswith('.dict'))
+
+        for name in names - variant_names:
+            self._add(name, 'identity', storage.path(name))
+
+    def _add(self, name, encoding, path):
+        stat = os.stat(path)
+        self.files.setdefault(name, dict())[encoding] = (path, stat.st_size, stat.st_mtime)
+
+    def lookup(self, name, accept_encoding, available_dictionary=''):
+        entry = self.files.get(name)
+        if entry is None:
+            return None
+
+        accepted = parse_accept_encoding(accept_encoding)
+        if (DICTIONARY_ENCODING in entry and DICTIONARY_ENCODING in accepted
+                and parse_available_dictionary(available_dictionary) == self.dictionary_digests[name]):
+            return (DICTIONARY_ENCODING,) + entry[DICTIONARY_ENCODING]
+
+        for (encoding, extension) in ENCODINGS:
+            if encoding in entry and (encoding in accepted or '*' in accepted):
+                return (encoding,) + entry[encoding]
+
+        if 'identity' in entry:
+            return ('identity',) + entry['identity']
+        return None
+
+
+def serve_compressed(request, index, name):
+    """
+    Return a response streaming the best precompressed variant of the file,
+    or the original when the client accepts none of them, None when the file
+    can't be served.
+    """
+    variant = index.lookup(name, request.META.get('HTTP_ACCEPT_ENCODING', ''),
+                           request.META.get('HTTP_AVAILABLE_DICTIONARY', ''))
+    if variant is None:
+        return None
+
+    (encoding, path, size, mtime) = variant
+    etag = '"{size:x}-{mtime:x}-{encoding}"'.format(size=size, mtime=int(mtime), encoding=encoding)
+
+    if HASHED_NAME_REGEX.search(name):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = 'public, max-age={max_age}'.format(
+            max_age=getattr(settings, "STATIC_COMPRESS_SERVE_MAX_AGE", 60))
+
+    # Weak ETags, * and If-Modified-Since are handled as by Django's
+    # conditional GET.
+    response = get_conditional_response(request, etag=etag, last_modified=int(mtime))
+    if response is None:
+        (content_type, _) = mimetypes.guess_type(name)
+        response = FileResponse(open(path, 'rb'), content_type=content_type or 'application/octet-stream')
+        # FileResponse would name the variant in an inline Content-Disposition,
+        # which the static files never had.
+        if response.has_header('Content-Disposition'):
+            del response['Content-Disposition']
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(size)
+        response['Last-Modified'] = http_date(mtime)
+        if name in index.dictionaries:
+            # The browser keeps it to decompress the .dcz files of STATIC_URL.
+            response['Use-As-Dictionary'] = 'match="{path}*"'.format(path=urlparse(settings.STATIC_URL).path)
+
+    response['ETag'] = etag
+    if name in index.dictionary_digests:
+        response['Vary'] = 'Accept-Encoding, Available-Dictionary'
+    else:
+        response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,10 @@
+from django.dispatch import Signal
+
+__all__ = ["phase_finished", "build_finished"]
+
+# Sent every time a phase of collectstatic_compress is measured, with the
+# phase name and the BuildStats as `phase` and `stats` arguments.
+phase_finished = Signal()
+
+# Sent at the end of collectstatic_compress, with the BuildStats as `stats`.
+build_finished = Signal()
@@ -0,0 +1,158 @@
+import os
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from static_compressor.signals import phase_finished
+
+__all__ = ["BuildStats"]
+
+
+def cpu_time():
+    # The children are the worker processes of the parallel scan and
+    # compression, counted once their pool is shut down.
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+class BuildStats:
+    """
+    Wall time, CPU time, bytes in and out and memory peak of every phase of
+    collectstatic_compress, per file type, and the time spent on every file.
+
+    The memory is only traced with trace_memory, tracemalloc slows everything
+    down.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.phases = OrderedDict()
+        self.file_types = dict()
+        self.files = dict()
+        self.started = None
+        self.total = None
+        self.peak_memory = 0
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.started = (time.perf_counter(), cpu_time())
+
+    def finish(self):
+        (wall, cpu) = self.started
+        self.total = {'wall_seconds': time.perf_counter() - wall, 'cpu_seconds': cpu_time() - cpu}
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.total['peak_memory_bytes'] = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    def _phase(self, name):
+        if name not in self.phases:
+            self.phases[name] = {
+                'wall_seconds': 0.0,
+                'cpu_seconds': 0.0,
+                'bytes_in': 0,
+                'bytes_out': 0,
+                'peak_memory_bytes': None,
+            }
+        return self.phases[name]
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measure a phase, which can be entered several times (once per file)
+        and then adds up.
+        """
+        memory = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            if hasattr(tracemalloc, 'reset_peak'):
+                # The peak of the whole build is kept before every reset.
+                self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+            memory = tracemalloc.get_traced_memory()[0]
+
+        (wall, cpu) = (time.perf_counter(), cpu_time())
+        try:
+            yield
+        finally:
+            stats = self._phase(name)
+            stats['wall_seconds'] += time.perf_counter() - wall
+            stats['cpu_seconds'] += cpu_time() - cpu
+            if memory is not None:
+                peak = max(tracemalloc.get_traced_memory()[1] - memory, 0)
+                stats['peak_memory_bytes'] = max(stats['peak_memory_bytes'] or 0, peak)
+
+            phase_finished.send(sender=self.__class__, phase=name, stats=self)
+
+    def add_bytes(self, phase, bytes_in=0, bytes_out=0):
+        stats = self._phase(phase)
+        stats['bytes_in'] += bytes_in
+        stats['bytes_out'] += bytes_out
+
+    def record_file(self, phase, name, seconds, bytes_in, bytes_out):
+        """
+        Add the time and sizes of one file to its type and to the file itself.
+
+        The bytes are added to the phase too, but not the time, which is
+        measured by phase().
+        """
+        self.add_bytes(phase, bytes_in, bytes_out)
+
+        file_type = os.path.splitext(name)[1][1:] or 'other'
+        stats = self.file_types.setdefault(file_type, dict()).setdefault(
+            phase, {'files': 0, 'seconds': 0.0, 'bytes_in': 0, 'bytes_out': 0})
+        stats['files'] += 1
+        stats['seconds'] += seconds
+        stats['bytes_in'] += bytes_in
+        stats['bytes_out'] += bytes_out
+
+        file_stats = self.files.setdefault(name, {'seconds': 0.0})
+        file_stats['seconds'] += seconds
+        file_stats[phase] = file_stats.get(phase, 0.0) + seconds
+
+    def slowest(self, count):
+        return sorted(self.files.items(), key=lambda item: item[1]['seconds'], reverse=True)[:count]
+
+    def as_dict(self, slowest=10):
+        return {
+            'total': self.total,
+            'phases': self.phases,
+            'file_types': self.file_types,
+            'slowest_files': [dict(stats, name=name) for (name, stats) in self.slowest(slowest)],
+        }
+
+    def report(self, slowest=10):
+        """
+        Human readable tables of the stats, as a list of lines.
+        """
+        def peak(stats):
+            if stats.get('peak_memory_bytes') is None:
+                return '{:>10}'.format('-')
+            return '{:>8.1f}MB'.format(stats['peak_memory_bytes'] / 1024 / 1024)
+
+        lines = ['{:<14}{:>10}{:>10}{:>14}{:>14}{:>10}'.format(
+            'Phase', 'Wall', 'CPU', 'In', 'Out', 'Peak')]
+        for (name, stats) in self.phases.items():
+            lines.append('{name:<14}{wall_seconds:>9.2f}s{cpu_seconds:>9.2f}s{bytes_in:>14}{bytes_out:>14}{peak}'.format(
+                name=name, peak=peak(stats), **stats))
+        if self.total is not None:
+            lines.append('{name:<14}{wall_seconds:>9.2f}s{cpu_seconds:>9.2f}s{empty:>28}{peak}'.format(
+                name='total', empty='', peak=peak(self.total), **self.total))
+
+        lines.append('')
+        lines.append('{:<14}{:<14}{:>8}{:>10}{:>14}{:>14}'.format('Type', 'Phase', 'Files', 'Time', 'In', 'Out'))
+        for (file_type, phases) in sorted(self.file_types.items()):
+            for (name, stats) in phases.items():
+                lines.append('{type:<14}{name:<14}{files:>8}{seconds:>9.2f}s{bytes_in:>14}{bytes_out:>14}'.format(
+                    type=file_type, name=name, **stats))
+
+        if slowest:
+            lines.append('')
+            lines.append('Slowest files:')
+            for (name, stats) in self.slowest(slowest):
+                lines.append('{seconds:>9.3f}s  {name}  ({phases})'.format(
+                    seconds=stats['seconds'], name=name, phases=', '.join(
+                        '{phase} {seconds:.3f}s'.format(phase=phase, seconds=seconds)
+                        for (phase, seconds) in stats.items() if phase != 'seconds')))
+
+        return lines
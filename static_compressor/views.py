@@ -0,0 +1,43 @@
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import Http404, HttpResponse
+
+from static_compressor.metrics import middleware_metrics
+from static_compressor.serving import CompressedFilesIndex, serve_compressed
+
+__all__ = ["serve", "metrics"]
+
+_index = None
+
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = CompressedFilesIndex(staticfiles_storage)
+    return _index
+
+
+def serve(request, path):
+    """
+    Serve the precompressed variant of a collected static file, or the file
+    itself when the client accepts none of them.
+
+    urlpatterns += [
+        re_path(r'^static/(?P<path>.*)$', static_compressor.views.serve),
+    ]
+    """
+    response = serve_compressed(request, get_index(), path)
+    if response is None:
+        raise Http404("'{path}' could not be found".format(path=path))
+    return response
+
+
+def metrics(request):
+    """
+    Expose the metrics of MinifyClassMiddleware in the Prometheus text format.
+    Route it behind your own access control.
+
+    urlpatterns += [
+        path('metrics/minify-class', static_compressor.views.metrics),
+    ]
+    """
+    return HttpResponse(middleware_metrics.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
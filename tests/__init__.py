@@ -0,0 +1,10 @@
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        SECRET_KEY='tests',
+        INSTALLED_APPS=['django.contrib.staticfiles', 'static_compressor'],
+        STATIC_URL='/static/',
+    )
+    django.setup()
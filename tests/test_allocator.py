@@ -0,0 +1,67 @@
+import itertools
+import unittest
+
+from static_compressor.allocator import NameEncoder, allocate_names
+
+ALPHABET = 'ab1'
+
+
+class NameEncoderTest(unittest.TestCase):
+
+    def test_same_order_as_product(self):
+        expected = [''.join(name)
+                    for size in range(1, 5)
+                    for name in itertools.product(ALPHABET, repeat=size)
+                    if not name[0].isdigit()]
+
+        names = NameEncoder(ALPHABET).iter_names(set())
+        self.assertEqual([next(names) for _ in expected], expected)
+
+    def test_skips_used_names(self):
+        names = NameEncoder(ALPHABET).iter_names({'a', 'ab'})
+        self.assertEqual([next(names) for _ in range(4)], ['b', 'aa', 'a1', 'ba'])
+
+    def test_digits_only(self):
+        with self.assertRaises(Exception):
+            NameEncoder('123')
+
+
+class AllocateNamesTest(unittest.TestCase):
+
+    def test_heaviest_classes_get_shortest_names(self):
+        names = allocate_names({'header': 1, 'footer': 5, 'sidebar': 3}, ALPHABET)
+
+        self.assertEqual(list(names.items()), [('footer', 'a'), ('sidebar', 'b'), ('header', 'aa')])
+
+    def test_ties_are_ordered_by_name(self):
+        names = allocate_names({'menu': 2, 'card': 2}, ALPHABET)
+
+        self.assertEqual(list(names), ['card', 'menu'])
+
+    def test_short_class_keeps_its_name(self):
+        names = allocate_names({'b': 10, 'header': 5}, ALPHABET)
+
+        # 'a' would be as long as 'b', so it goes to the next class.
+        self.assertEqual(names, {'b': 'b', 'header': 'a'})
+
+    def test_never_reuses_an_original_name(self):
+        names = allocate_names({'header': 5, 'a': 1}, ALPHABET)
+
+        self.assertEqual(names, {'header': 'b', 'a': 'a'})
+
+    def test_reserved_names(self):
+        names = allocate_names({'header': 5, 'footer': 3}, ALPHABET, reserved_names={'a', 'b'})
+
+        self.assertEqual(names, {'header': 'aa', 'footer': 'ab'})
+
+    def test_previous_names_are_kept(self):
+        previous_names = {'header': 'b', 'footer': 'a'}
+        names = allocate_names({'header': 5, 'footer': 3, 'sidebar': 4}, ALPHABET, previous_names)
+
+        self.assertEqual(names, {'header': 'b', 'sidebar': 'aa', 'footer': 'a'})
+
+    def test_invalid_previous_names_are_replaced(self):
+        previous_names = {'header': 'footer', 'footer': 'a'}
+        names = allocate_names({'header': 5, 'footer': 3}, ALPHABET, previous_names)
+
+        self.assertEqual(names, {'header': 'b', 'footer': 'a'})
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+from static_compressor import cache
+from static_compressor.cache import CompressionCache, ExtractionCache, RewriteCache
+from static_compressor.compressors import BrotliCompressor, ZlibCompressor, ZopfliCompressor
+from static_compressor.mixin import compress_file
+
+
+class ExtractionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_file_name = os.path.join(self.directory, 'data.cache.json')
+        self.path = os.path.join(self.directory, 'app.css')
+        self.write('.btn{}')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, content, mtime=None):
+        with open(self.path, 'w') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def cached(self, classes):
+        extraction_cache = ExtractionCache(self.cache_file_name)
+        (unchanged, digest) = extraction_cache.lookup(self.path, os.stat(self.path))
+        self.assertFalse(unchanged)
+        extraction_cache.update(self.path, os.stat(self.path), Counter(classes), digest)
+        extraction_cache.save()
+        return ExtractionCache(self.cache_file_name)
+
+    def test_unchanged(self):
+        extraction_cache = self.cached({'btn': 1})
+
+        with mock.patch.object(cache, 'file_digest', wraps=cache.file_digest) as file_digest:
+            self.assertEqual(extraction_cache.lookup(self.path, os.stat(self.path)), (True, None))
+        self.assertEqual(file_digest.call_count, 0)
+        self.assertEqual(extraction_cache.frequency, {'btn': 1})
+
+    def test_touched(self):
+        extraction_cache = self.cached({'btn': 1})
+        self.write('.btn{}', mtime=1)
+
+        (unchanged, digest) = extraction_cache.lookup(self.path, os.stat(self.path))
+        self.assertTrue(unchanged)
+
+    def test_changed_content_is_hashed_once(self):
+        extraction_cache = self.cached({'btn': 1})
+        self.write('.nav{}', mtime=1)
+
+        with mock.patch.object(cache, 'file_digest', wraps=cache.file_digest) as file_digest:
+            (unchanged, digest) = extraction_cache.lookup(self.path, os.stat(self.path))
+            self.assertFalse(unchanged)
+            extraction_cache.update(self.path, os.stat(self.path), Counter({'nav': 1}), digest)
+
+        self.assertEqual(file_digest.call_count, 1)
+        self.assertEqual(+extraction_cache.frequency, {'nav': 1})
+
+    def test_removed(self):
+        extraction_cache = self.cached({'btn': 1})
+        extraction_cache.remove_missing([])
+
+        self.assertEqual(+extraction_cache.frequency, {})
+
+
+class RewriteCacheTest(unittest.TestCase):
+
+    def test_least_recently_used(self):
+        rewrite_cache = RewriteCache(max_entries=2)
+        rewrite_cache.set('a', b'1')
+        rewrite_cache.set('b', b'2')
+        rewrite_cache.get('a')
+        rewrite_cache.set('c', b'3')
+
+        self.assertEqual(list(rewrite_cache.entries), ['a', 'c'])
+
+    def test_max_size(self):
+        rewrite_cache = RewriteCache(max_size=10, max_entry_size=6)
+        rewrite_cache.set('big', b'x' * 7)
+        rewrite_cache.set('a', b'x' * 6)
+        rewrite_cache.set('b', b'x' * 6)
+
+        self.assertEqual(list(rewrite_cache.entries), ['b'])
+        self.assertEqual(rewrite_cache.size, 6)
+
+    def test_counters(self):
+        rewrite_cache = RewriteCache()
+        rewrite_cache.get('a')
+        rewrite_cache.set('a', b'1')
+        self.assertEqual(rewrite_cache.get('a'), b'1')
+
+        self.assertEqual((rewrite_cache.hits, rewrite_cache.misses), (1, 1))
+
+    def test_key_holds_the_version(self):
+        rewrite_cache = RewriteCache()
+        self.assertNotEqual(rewrite_cache.make_key(b'<p>', '1'), rewrite_cache.make_key(b'<p>', '2'))
+        self.assertNotEqual(rewrite_cache.make_key(b'<p>', '1'), rewrite_cache.make_key(b'<a>', '1'))
+
+
+class CompressionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.compression_cache = CompressionCache(os.path.join(self.directory, 'cache'))
+        self.paths = list()
+        for index in range(4):
+            path = os.path.join(self.directory, '{index}.css'.format(index=index))
+            with open(path, 'w') as f:
+                f.write('.btn-{index}{{color:red}}'.format(index=index) * 100)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compress(self, compressor, path):
+        (temp_path, seconds) = compress_file(compressor, path, path, self.compression_cache)
+        with open(temp_path, 'rb') as f:
+            content = f.read()
+        os.remove(temp_path)
+        return content
+
+    def test_hit_is_identical(self):
+        compressor = BrotliCompressor(quality=5)
+        count = len(self.paths)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(compress_file, [compressor] * count, self.paths, self.paths,
+                                        [self.compression_cache] * count))
+
+        for (path, (temp_path, seconds)) in zip(self.paths, results):
+            with open(temp_path, 'rb') as f:
+                compressed = f.read()
+            os.remove(temp_path)
+
+            with mock.patch.object(BrotliCompressor, 'compress_to') as compress_to:
+                self.assertEqual(self.compress(compressor, path), compressed)
+            self.assertEqual(compress_to.call_count, 0)
+
+    def test_key_holds_the_options(self):
+        digest = cache.file_digest(self.paths[0], hashlib.sha256())
+        keys = set(self.compression_cache.make_key(digest, compressor) for compressor in (
+            BrotliCompressor(quality=5), BrotliCompressor(), ZlibCompressor(), ZlibCompressor(level=6),
+            ZopfliCompressor(), ZopfliCompressor(max_size=1024)))
+
+        self.assertEqual(len(keys), 6)
+
+    def test_evict_least_recently_used(self):
+        compressor = ZlibCompressor()
+        entries = list()
+        for (index, path) in enumerate(self.paths):
+            self.compress(compressor, path)
+            key = self.compression_cache.make_key(cache.file_digest(path, hashlib.sha256()), compressor)
+            entries.append(self.compression_cache._path(key))
+            os.utime(entries[-1], (index, index))
+
+        # The hit on the first file makes it the most recently used.
+        self.compress(compressor, self.paths[0])
+        self.compression_cache.max_size = os.path.getsize(entries[0]) + os.path.getsize(entries[3])
+        self.compression_cache.evict()
+
+        self.assertEqual([os.path.exists(path) for path in entries], [True, False, False, True])
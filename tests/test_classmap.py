@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from static_compressor.classmap import ClassMapWatcher, MappedClassMap, class_map_version, write_class_map
+
+
+class MappedClassMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'data.map')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def round_trip(self, data):
+        write_class_map(self.file_name, data)
+        return MappedClassMap(self.file_name)
+
+    def test_round_trip(self):
+        data = dict(('class-{index}'.format(index=index), 'n{index}'.format(index=index)) for index in range(1000))
+        data['card'] = 'card'
+        class_map = self.round_trip(data)
+
+        self.assertEqual(len(class_map), len(data))
+        self.assertEqual(dict(class_map), data)
+        self.assertEqual(sorted(class_map), sorted(data))
+        for (key, value) in data.items():
+            self.assertIn(key, class_map)
+            self.assertEqual(class_map[key], value)
+
+    def test_non_ascii_names(self):
+        data = {'bouton-validé': 'a', 'カード': 'b', 'btn': 'c'}
+
+        self.assertEqual(dict(self.round_trip(data)), data)
+
+    def test_missing_names(self):
+        class_map = self.round_trip({'btn': 'a'})
+
+        self.assertNotIn('card', class_map)
+        self.assertNotIn(None, class_map)
+        self.assertIsNone(class_map.get('card'))
+        self.assertEqual(class_map.get('card', 'card'), 'card')
+        with self.assertRaises(KeyError):
+            class_map['card']
+
+    def test_empty(self):
+        class_map = self.round_trip(dict())
+
+        self.assertEqual(len(class_map), 0)
+        self.assertNotIn('btn', class_map)
+
+    def test_version(self):
+        data = {'btn': 'a', 'card': 'b'}
+
+        self.assertEqual(self.round_trip(data).version, class_map_version(data).hex())
+
+    def test_rewrite(self):
+        self.round_trip({'btn': 'a'})
+        class_map = self.round_trip({'btn': 'b', 'card': 'c'})
+
+        self.assertEqual(dict(class_map), {'btn': 'b', 'card': 'c'})
+
+    def test_not_a_class_map(self):
+        with open(self.file_name, 'wb') as f:
+            f.write(b'{"btn": "a"}')
+
+        with self.assertRaises(ValueError):
+            MappedClassMap(self.file_name)
+
+
+class ClassMapWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.json_file_name = os.path.join(self.directory, 'data.json')
+        self.map_file_name = os.path.join(self.directory, 'data.map')
+        self.write({'btn': 'a'})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        with open(self.json_file_name, 'w') as f:
+            json.dump(data, f)
+
+    def test_reload(self):
+        watcher = ClassMapWatcher(self.json_file_name, self.map_file_name, interval=0)
+        self.write({'btn': 'b', 'card': 'c'})
+
+        watcher.get()
+        watcher.reload_thread.join()
+
+        self.assertEqual(dict(watcher.get().data), {'btn': 'b', 'card': 'c'})
+
+    def test_requests_dont_wait_for_the_reload(self):
+        loading = threading.Event()
+        release = threading.Event()
+
+        class SlowWatcher(ClassMapWatcher):
+            def _load(self):
+                if self.rewriter is not None:
+                    loading.set()
+                    release.wait(5)
+                return super()._load()
+
+        SlowWatcher.rewriter = None
+        watcher = SlowWatcher(self.json_file_name, self.map_file_name, interval=0)
+        previous = watcher.get()
+        self.write({'btn': 'b', 'card': 'c'})
+
+        self.assertIs(watcher.get(), previous)
+        self.assertTrue(loading.wait(5))
+        self.assertIs(watcher.get(), previous)
+
+        release.set()
+        watcher.reload_thread.join()
+        self.assertIsNot(watcher.get(), previous)
+
+    def test_unchanged(self):
+        watcher = ClassMapWatcher(self.json_file_name, self.map_file_name, interval=0)
+        previous = watcher.get()
+
+        self.assertIs(watcher.get(), previous)
+        self.assertIsNone(watcher.reload_thread)
+
+    def test_invalid_json_keeps_the_current_map(self):
+        watcher = ClassMapWatcher(self.json_file_name, self.map_file_name, interval=0)
+        previous = watcher.get()
+        with open(self.json_file_name, 'w') as f:
+            f.write('{"btn": ')
+
+        watcher.get()
+        watcher.reload_thread.join()
+
+        self.assertFalse(watcher.lock.locked())
+        self.assertIs(watcher.rewriter, previous)
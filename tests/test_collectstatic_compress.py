@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.test import override_settings
+
+from static_compressor.management.commands.collectstatic_compress import Command
+
+FILES = {
+    'static/css/app.css': '.btn{} .btn-primary:hover{} .card .nav{}',
+    'static/js/app.js': "el.classList.add('btn');document.querySelector('.card')",
+    'static/img/icon.svg': '<svg class="icon"><style>.icon{}</style></svg>',
+    'templates/page.html': '<div class="btn card page">{% if x %}<p class="nav">{% endif %}</div>',
+    'templates/base.html': '<body class="page">',
+}
+
+
+class CollectClassesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for (name, content) in FILES.items():
+            self.write(name, content)
+        for index in range(20):
+            self.write('static/css/{index}.css'.format(index=index), '.item-{index}{{}} .btn{{}}'.format(index=index))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def collect(self, jobs=1, cache=False):
+        with override_settings(
+                STATICFILES_DIRS=(os.path.join(self.directory, 'static'),),
+                STATIC_CLASSES_FILE_NAME=os.path.join(self.directory, 'data.json'),
+                STATIC_CLASSES_CACHE=cache,
+                TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates',
+                            'DIRS': [os.path.join(self.directory, 'templates')]}]):
+            command = Command()
+
+        command.verbosity = 0
+        command.jobs = jobs
+        scanned = list()
+        extract_classes = command._extract_classes
+
+        def spy(paths):
+            scanned.extend(paths)
+            return extract_classes(paths)
+
+        command._extract_classes = spy
+        command._collect_classes()
+        return command, scanned
+
+    def test_jobs(self):
+        (serial, _) = self.collect()
+        (parallel, _) = self.collect(jobs=2)
+
+        self.assertEqual(parallel.frequency, serial.frequency)
+        self.assertEqual(parallel.template_frequency, serial.template_frequency)
+        self.assertEqual(serial.template_frequency['page'], 2)
+        self.assertEqual(serial.frequency['item-3'], 1)
+
+    def test_cache(self):
+        (uncached, _) = self.collect()
+        (first, first_scanned) = self.collect(cache=True)
+        (second, second_scanned) = self.collect(cache=True)
+
+        self.assertEqual(len(first_scanned), 25)
+        self.assertEqual(second_scanned, [])
+        self.assertEqual(+second.frequency, +uncached.frequency)
+        self.assertEqual(+second.template_frequency, +uncached.template_frequency)
+
+    def test_cache_changed_template(self):
+        self.collect(cache=True)
+        self.write('templates/base.html', '<body class="page home">')
+        (command, scanned) = self.collect(cache=True)
+
+        self.assertEqual(scanned, [os.path.join(self.directory, 'templates/base.html')])
+        self.assertEqual(command.template_frequency['home'], 1)
+        self.assertEqual(command.template_frequency['page'], 2)
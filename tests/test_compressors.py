@@ -0,0 +1,54 @@
+import gzip
+import io
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from static_compressor.compressors import ZlibCompressor, ZopfliCompressor
+from static_compressor.mixin import compress_file
+
+CONTENT = b'.btn{color:red}.card{margin:0}' * 1000
+
+
+class ZopfliCompressorTest(unittest.TestCase):
+
+    def compress(self, compressor, content):
+        output = io.BytesIO()
+        compressor.compress_to(io.BytesIO(content), output)
+        return output.getvalue()
+
+    def test_round_trip(self):
+        self.assertEqual(gzip.decompress(self.compress(ZopfliCompressor(), CONTENT)), CONTENT)
+
+    def test_bigger_than_max_size(self):
+        compressed = self.compress(ZopfliCompressor(max_size=1024), CONTENT)
+
+        self.assertEqual(compressed, self.compress(ZlibCompressor(), CONTENT))
+
+    def test_signature(self):
+        self.assertNotEqual(ZopfliCompressor(max_size=1024).signature(), ZopfliCompressor().signature())
+
+
+class CompressFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.full_path = os.path.join(self.directory, 'app.css')
+        with open(self.full_path, 'wb') as f:
+            f.write(CONTENT)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_readable_by_the_web_server(self):
+        umask = os.umask(0o022)
+        try:
+            (temp_path, seconds) = compress_file(ZlibCompressor(), 'app.css', self.full_path)
+        finally:
+            os.umask(umask)
+
+        self.assertEqual(stat.S_IMODE(os.stat(temp_path).st_mode), 0o644)
+        with open(temp_path, 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), CONTENT)
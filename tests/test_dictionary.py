@@ -0,0 +1,71 @@
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import zstandard
+from django.test import override_settings
+
+from static_compressor.dictionary import read_dictionary_digest
+from static_compressor.staticfiles_storage import CompressedStaticFilesStorage
+from static_compressor.stats import BuildStats
+
+
+def make_stylesheets(count, seed=0):
+    random_generator = random.Random(seed)
+    return [''.join('.btn-{index}{{color:#{color:06x};margin:{margin}px}} .card .nav-item{{padding:0}}'.format(
+        index=random_generator.randint(0, 50), color=random_generator.randint(0, 0xffffff),
+        margin=random_generator.randint(0, 99)) for _ in range(random_generator.randint(5, 30))).encode()
+        for _ in range(count)]
+
+
+class DictionaryCompressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.files = list()
+        for (index, content) in enumerate(make_stylesheets(200)):
+            name = 'css/{index}.css'.format(index=index)
+            path = os.path.join(self.directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+            self.files.append((name, path, content))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compress(self, executor=None):
+        with override_settings(STATIC_COMPRESS_METHODS=['gz'], STATIC_COMPRESS_DICTIONARY_SIZE_KB=4,
+                               STATIC_COMPRESS_DICTIONARY_LEVEL=3):
+            storage = CompressedStaticFilesStorage(location=self.directory)
+        saved = list(storage._compress_with_dictionary(
+            [(name, path) for (name, path, content) in self.files], BuildStats(), executor))
+
+        compressed = dict()
+        for (name, saved_name, processed) in saved:
+            with storage.open(saved_name) as f:
+                compressed[saved_name] = f.read()
+        return compressed
+
+    def test_round_trip(self):
+        compressed = self.compress()
+        (dictionary_name,) = [name for name in compressed if name.endswith('.dict')]
+        dictionary = zstandard.ZstdCompressionDict(compressed[dictionary_name])
+        decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        digest = hashlib.sha256(compressed[dictionary_name]).digest()
+
+        for (name, path, content) in self.files:
+            dcz = compressed[name + '.dcz']
+            self.assertEqual(read_dictionary_digest(os.path.join(self.directory, name + '.dcz')), digest)
+            self.assertEqual(decompressor.decompress(dcz[40:]), content)
+
+    def test_same_files_with_jobs(self):
+        serial = self.compress()
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            parallel = self.compress(executor)
+
+        self.assertEqual(parallel, serial)
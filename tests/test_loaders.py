@@ -0,0 +1,54 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.template import Context, Engine
+from django.test import override_settings
+
+
+class LoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.json_file_name = os.path.join(self.directory, 'data.json')
+        self.write({'btn': 'a'})
+        with open(os.path.join(self.directory, 'page.html'), 'w') as f:
+            f.write('<div class="btn {{ extra }}">{% if x %}x{% endif %}</div>')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        with open(self.json_file_name, 'w') as f:
+            json.dump(data, f)
+
+    def engine(self):
+        with override_settings(MINIFY_CLASS_HTML=True, STATIC_CLASSES_FILE_NAME=self.json_file_name,
+                               MINIFY_CLASS_RELOAD_INTERVAL=0):
+            engine = Engine(dirs=[self.directory], loaders=[
+                ('static_compressor.loaders.Loader', ['django.template.loaders.filesystem.Loader']),
+            ])
+            # The loaders are created on first use.
+            engine.template_loaders
+        return engine
+
+    def render(self, engine):
+        return engine.get_template('page.html').render(Context({'extra': 'btn'}))
+
+    def test_rewritten_once(self):
+        engine = self.engine()
+
+        self.assertEqual(self.render(engine), '<div class="a btn"></div>')
+        self.assertEqual(self.render(engine), '<div class="a btn"></div>')
+
+    def test_reload(self):
+        engine = self.engine()
+        self.render(engine)
+        self.write({'btn': 'b', 'card': 'c'})
+
+        engine.get_template('page.html')
+        engine.template_loaders[0].class_map.reload_thread.join()
+
+        self.assertEqual(self.render(engine), '<div class="b btn"></div>')
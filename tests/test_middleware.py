@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+import brotli
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from static_compressor.middleware import MinifyClassMiddleware
+
+CLASS_MAP = {'btn': 'a', 'card': 'b'}
+
+PAGE = '<div class="btn card">' + 'x' * 500 + '</div>'
+
+
+class MiddlewareTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.json_file_name = os.path.join(self.directory, 'data.json')
+        with open(self.json_file_name, 'w') as f:
+            json.dump(CLASS_MAP, f)
+        self.request_factory = RequestFactory()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def middleware(self, view, **options):
+        with override_settings(STATIC_CLASSES_FILE_NAME=self.json_file_name, MINIFY_CLASS_HTML=True, **options):
+            return MinifyClassMiddleware(view)
+
+
+def page_view(status=200, etag=None, content=PAGE):
+    def view(request):
+        response = HttpResponse(content, status=status)
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+    return view
+
+
+class ETagTest(MiddlewareTestCase):
+
+    def test_no_etag_by_default(self):
+        response = self.middleware(page_view(etag='"view"'))(self.request_factory.get('/'))
+
+        self.assertEqual(response.content, PAGE.replace('btn card', 'a b').encode())
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_content_etag(self):
+        middleware = self.middleware(page_view(), MINIFY_CLASS_ETAG='content')
+        etag = middleware(self.request_factory.get('/'))['ETag']
+
+        for if_none_match in (etag, 'W/' + etag, '*'):
+            response = middleware(self.request_factory.get('/', HTTP_IF_NONE_MATCH=if_none_match))
+
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response.content, b'')
+
+        self.assertEqual(middleware(self.request_factory.get('/', HTTP_IF_NONE_MATCH='"other"')).status_code, 200)
+
+    def test_derived_etag(self):
+        middleware = self.middleware(page_view(etag='"view"'), MINIFY_CLASS_ETAG='derived')
+        etag = middleware(self.request_factory.get('/'))['ETag']
+
+        self.assertNotEqual(etag, '"view"')
+        self.assertEqual(middleware(self.request_factory.get('/', HTTP_IF_NONE_MATCH=etag)).status_code, 304)
+
+    def test_only_200_responses_are_not_modified(self):
+        for status in (201, 202, 206):
+            middleware = self.middleware(page_view(status=status), MINIFY_CLASS_ETAG='content')
+            etag = middleware(self.request_factory.get('/'))['ETag']
+            response = middleware(self.request_factory.get('/', HTTP_IF_NONE_MATCH=etag))
+
+            self.assertEqual(response.status_code, status)
+            self.assertEqual(response.content, PAGE.replace('btn card', 'a b').encode())
+
+    def test_post_is_not_modified(self):
+        middleware = self.middleware(page_view(), MINIFY_CLASS_ETAG='content')
+        etag = middleware(self.request_factory.get('/'))['ETag']
+
+        self.assertEqual(middleware(self.request_factory.post('/', HTTP_IF_NONE_MATCH=etag)).status_code, 200)
+
+
+class RewriteCacheTest(MiddlewareTestCase):
+
+    def test_same_body(self):
+        middleware = self.middleware(page_view(), MINIFY_CLASS_CACHE=True)
+        responses = [middleware(self.request_factory.get('/')) for _ in range(3)]
+
+        for response in responses:
+            self.assertEqual(response.content, PAGE.replace('btn card', 'a b').encode())
+        self.assertEqual((middleware.cache.hits, middleware.cache.misses), (2, 1))
+
+    def test_shared_backend(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            (first, second) = [self.middleware(page_view(), MINIFY_CLASS_CACHE=True, MINIFY_CLASS_CACHE_BACKEND='default')
+                               for _ in range(2)]
+            first(self.request_factory.get('/'))
+            response = second(self.request_factory.get('/'))
+
+        self.assertEqual(response.content, PAGE.replace('btn card', 'a b').encode())
+        self.assertEqual((second.cache.hits, second.cache.misses), (1, 0))
+
+
+class CompressTest(MiddlewareTestCase):
+
+    def compress(self, accept_encoding, content=PAGE, **options):
+        middleware = self.middleware(page_view(content=content), MINIFY_CLASS_COMPRESS=True, **options)
+        return middleware(self.request_factory.get('/', HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    def test_brotli(self):
+        response = self.compress('gzip, br', MINIFY_CLASS_BROTLI_QUALITY=4)
+        rewritten = PAGE.replace('btn card', 'a b').encode()
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.content, brotli.compress(rewritten, quality=4))
+        self.assertEqual(brotli.decompress(response.content), rewritten)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    def test_gzip(self):
+        response = self.compress('gzip;q=1, br;q=0')
+        rewritten = PAGE.replace('btn card', 'a b').encode()
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response.content, compressor.compress(rewritten) + compressor.flush())
+        self.assertEqual(zlib.decompress(response.content, 31), rewritten)
+
+    def test_identity(self):
+        response = self.compress('deflate')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.content, PAGE.replace('btn card', 'a b').encode())
+
+    def test_min_size(self):
+        response = self.compress('br', MINIFY_CLASS_COMPRESS_MIN_SIZE=len(PAGE) + 1)
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+
+    def test_etag_per_encoding(self):
+        etags = set(self.compress(accept_encoding, MINIFY_CLASS_ETAG='content')['ETag']
+                    for accept_encoding in ('br', 'gzip', ''))
+        self.assertEqual(len(etags), 3)
+
+
+class CharsetTest(MiddlewareTestCase):
+
+    def rewrite(self, content, charset):
+        middleware = self.middleware(lambda request: HttpResponse(
+            content.encode(charset), content_type='text/html; charset={charset}'.format(charset=charset)))
+        return middleware(self.request_factory.get('/')).content.decode(charset)
+
+    def test_single_byte_charset(self):
+        self.assertEqual(self.rewrite('<p class="btn">café</p>', 'latin-1'), '<p class="a">café</p>')
+
+    def test_multi_byte_charsets(self):
+        for charset in ('utf-16', 'shift_jis', 'big5', 'gbk', 'iso2022_jp'):
+            self.assertEqual(self.rewrite('<p class="btn card">表示</p>', charset), '<p class="a b">表示</p>', charset)
+
+    def test_ascii_bytes_inside_a_character(self):
+        # ツ is 0x83 'c' in Shift_JIS, the bytes of ツlass="btn" look like a
+        # class attribute but the text isn't one.
+        content = '<p>ツlass="btn"</p><div class="card">'
+        self.assertEqual(self.rewrite(content, 'shift_jis'), '<p>ツlass="btn"</p><div class="b">')
+
+
+class AsyncTest(MiddlewareTestCase):
+
+    def test_async_view(self):
+        async def view(request):
+            return page_view()(request)
+
+        middleware = self.middleware(view)
+
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = asyncio.run(middleware(self.request_factory.get('/')))
+        self.assertEqual(response.content, PAGE.replace('btn card', 'a b').encode())
+
+    def test_large_bodies_are_rewritten_in_threads(self):
+        content = PAGE * 10
+
+        async def view(request):
+            return page_view(content=content)(request)
+
+        middleware = self.middleware(view, MINIFY_CLASS_ASYNC_THRESHOLD_KB=1)
+
+        async def requests():
+            return await asyncio.gather(*[middleware(self.request_factory.get('/')) for _ in range(8)])
+
+        for response in asyncio.run(requests()):
+            self.assertEqual(response.content, content.replace('btn card', 'a b').encode())
+
+    def test_sync_view(self):
+        middleware = self.middleware(page_view())
+
+        self.assertFalse(iscoroutinefunction(middleware))
+        self.assertEqual(middleware(self.request_factory.get('/')).content, PAGE.replace('btn card', 'a b').encode())
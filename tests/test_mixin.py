@@ -0,0 +1,82 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import brotli
+from django.core.files.storage import FileSystemStorage
+from django.test import override_settings
+
+from static_compressor.staticfiles_storage import CompressedManifestStaticFilesStorage
+
+CLASS_MAP = {'btn-primary': 'a', 'btn': 'b', 'card': 'c'}
+
+
+class ParallelCompressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.json_file_name = os.path.join(self.directory, 'data.json')
+        with open(self.json_file_name, 'w') as f:
+            json.dump(CLASS_MAP, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def collect(self, jobs, keep_original=True):
+        source = os.path.join(self.directory, 'source')
+        location = os.path.join(self.directory, 'jobs{jobs}-{keep_original:d}'.format(
+            jobs=jobs, keep_original=keep_original))
+        for index in range(12):
+            path = os.path.join(source, 'css', '{index}.css'.format(index=index))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write('.btn-primary{color:red} .btn .card{margin:0}\n' * (index + 1) * 10)
+
+        with override_settings(STATIC_COMPRESS_METHODS=['gz', 'br'], STATIC_COMPRESS_MIN_SIZE_KB=0,
+                               STATIC_COMPRESS_KEEP_ORIGINAL=keep_original,
+                               STATIC_CLASSES_FILE_NAME=self.json_file_name):
+            storage = CompressedManifestStaticFilesStorage(location=location)
+
+        source_storage = FileSystemStorage(location=source)
+        paths = dict()
+        for name in sorted(os.listdir(os.path.join(source, 'css'))):
+            storage.save('css/' + name, source_storage.open('css/' + name))
+            paths['css/' + name] = (source_storage, 'css/' + name)
+        # The manifest storage yields the hashed files first.
+        processed = [item for item in storage.post_process(paths, jobs=jobs)
+                     if item[1].endswith(('.gz', '.br'))]
+
+        files = dict()
+        for (root, dirs, names) in os.walk(location):
+            for name in names:
+                with open(os.path.join(root, name), 'rb') as f:
+                    files[os.path.relpath(os.path.join(root, name), location)] = f.read()
+        return processed, files
+
+    def test_same_as_serial(self):
+        (serial, serial_files) = self.collect(jobs=1)
+        (parallel, parallel_files) = self.collect(jobs=2)
+
+        self.assertEqual(parallel, serial)
+        self.assertEqual(parallel_files, serial_files)
+        self.assertEqual(len(serial), 24)
+
+        (hashed_name, compressed_name, processed) = serial[0]
+        content = serial_files[hashed_name]
+        self.assertEqual(content, b'.a{color:red} .b .c{margin:0}\n' * 10)
+        self.assertEqual(gzip.decompress(serial_files[hashed_name + '.gz']), content)
+        self.assertEqual(brotli.decompress(serial_files[hashed_name + '.br']), content)
+
+    def test_keep_original(self):
+        (serial, serial_files) = self.collect(jobs=1, keep_original=False)
+        (parallel, parallel_files) = self.collect(jobs=2, keep_original=False)
+
+        self.assertEqual(parallel, serial)
+        self.assertEqual(parallel_files, serial_files)
+        for index in range(12):
+            self.assertNotIn(os.path.join('css', '{index}.css'.format(index=index)), parallel_files)
+        for (hashed_name, compressed_name, processed) in parallel:
+            self.assertIn(compressed_name, parallel_files)
@@ -0,0 +1,78 @@
+import itertools
+import re
+import unittest
+from collections import OrderedDict
+
+from static_compressor.rewriter import ClassRewriter
+
+# Class names sharing prefixes, with short names which aren't class names
+# themselves so the per-class substitutions can't rewrite them again.
+NAMES = ['btn', 'btn-primary', 'btn-primary-lg', 'btn-lg', 'card', 'card-body',
+         'card-body-footer', 'nav', 'navbar', 'navbar-nav', 'x', 'x-1']
+
+STYLESHEET = """
+/* .btn { "quoted" } */
+.{0} { color: red }
+.{0}:hover, .{0} > .{1}::before { background: url("icons/.btn.svg") }
+@media (min-width: 10px) { .{1}.{2} { content: '.card' } }
+.{1}-unknown, .{2}_other { margin: 0 }
+"""
+
+
+def per_class_data(names):
+    # data.json is ordered by length descending, longest class names first.
+    shorts = ('Z{index}'.format(index=index) for index in itertools.count())
+    return OrderedDict((name, next(shorts)) for name in sorted(names, key=len, reverse=True))
+
+
+def per_class_replace_selectors(data, text):
+    # The substitutions of the original _minify, one regex per class.
+    for (key, value) in data.items():
+        text = re.sub(r'\.{key}'.format(key=re.escape(key)), '.{value}'.format(value=value), text)
+    return text
+
+
+def per_class_replace_stylesheet(data, text):
+    text = re.sub(re.compile(r'/\*.*?\*/', re.DOTALL), '', text)
+
+    quoted = OrderedDict()
+    for (index, instance) in enumerate(OrderedDict.fromkeys(re.findall(r'[\'\"].*?[\'\"]', text))):
+        quoted[instance] = 'Q{index}Q'.format(index=index)
+        text = text.replace(instance, '"' + quoted[instance] + '"')
+
+    text = per_class_replace_selectors(data, text)
+
+    for (instance, placeholder) in quoted.items():
+        text = text.replace('"' + placeholder + '"', instance)
+    return text
+
+
+class ClassRewriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = per_class_data(NAMES)
+        self.rewriter = ClassRewriter(self.data)
+
+    def stylesheets(self):
+        for (first, second, third) in itertools.permutations(NAMES, 3):
+            yield STYLESHEET.replace('{0}', first).replace('{1}', second).replace('{2}', third)
+
+    def test_selectors_same_as_per_class(self):
+        for stylesheet in self.stylesheets():
+            self.assertEqual(self.rewriter.replace_selectors(stylesheet),
+                             per_class_replace_selectors(self.data, stylesheet))
+
+    def test_stylesheet_same_as_per_class(self):
+        for stylesheet in self.stylesheets():
+            self.assertEqual(self.rewriter.replace_stylesheet(stylesheet),
+                             per_class_replace_stylesheet(self.data, stylesheet))
+
+    def test_longest_name_wins(self):
+        self.assertEqual(
+            self.rewriter.replace_selectors('.btn .btn-primary .btn-primary-lg .btn-primary-lgx'),
+            '.{btn} .{primary} .{large} .{large}x'.format(
+                btn=self.data['btn'], primary=self.data['btn-primary'], large=self.data['btn-primary-lg']))
+
+    def test_quoted_strings_kept(self):
+        self.assertEqual(self.rewriter.replace_stylesheet('.btn { content: ".btn" }'),
+                         '.{btn} {{ content: ".btn" }}'.format(btn=self.data['btn']))
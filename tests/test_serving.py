@@ -0,0 +1,148 @@
+import base64
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import brotli
+from django.test import RequestFactory, override_settings
+
+from static_compressor.dictionary import DCZ_MAGIC
+from static_compressor.serving import CompressedFilesIndex, serve_compressed
+from static_compressor.staticfiles_storage import CompressedStaticFilesStorage
+
+CONTENT = b'.btn{color:red}' * 100
+
+
+class ServeCompressedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('app.css', CONTENT)
+        self.write('app.css.gz', gzip.compress(CONTENT))
+        self.write('app.css.br', brotli.compress(CONTENT))
+        self.write('downloads/archive.tar.gz', b'archive')
+        self.write('app.css.abc123.tmp', b'partial')
+        self.request_factory = RequestFactory()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def index(self, **options):
+        with override_settings(STATIC_COMPRESS_METHODS=['gz', 'br'], **options):
+            return CompressedFilesIndex(CompressedStaticFilesStorage(location=self.directory))
+
+    def serve(self, name, index=None, **headers):
+        return serve_compressed(self.request_factory.get('/static/' + name, **headers), index or self.index(), name)
+
+    def test_negotiation(self):
+        for (accept_encoding, encoding, content) in (
+                ('gzip, deflate, br', 'br', brotli.compress(CONTENT)),
+                ('gzip', 'gzip', gzip.compress(CONTENT)),
+                ('br;q=0, gzip', 'gzip', gzip.compress(CONTENT)),
+                ('', None, CONTENT)):
+            response = self.serve('app.css', HTTP_ACCEPT_ENCODING=accept_encoding)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get('Content-Encoding'), encoding)
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertEqual(response['Content-Length'], str(len(content)))
+            self.assertFalse(response.has_header('Content-Disposition'))
+            self.assertEqual(b''.join(response.streaming_content), content)
+
+    def test_other_files_are_served_as_is(self):
+        response = self.serve('downloads/archive.tar.gz', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), b'archive')
+        self.assertIsNone(self.serve('downloads/archive.tar', HTTP_ACCEPT_ENCODING='gzip'))
+
+    def test_temporary_files_are_not_served(self):
+        self.assertIsNone(self.serve('app.css.abc123.tmp'))
+
+    def test_deleted_originals(self):
+        os.remove(os.path.join(self.directory, 'app.css'))
+        index = self.index(STATIC_COMPRESS_KEEP_ORIGINAL=False)
+
+        self.assertEqual(self.serve('app.css', index, HTTP_ACCEPT_ENCODING='gzip')['Content-Encoding'], 'gzip')
+        self.assertIsNone(self.serve('app.css', index))
+        self.assertIsNone(self.serve('app.css.gz', index))
+
+    def test_not_modified(self):
+        etag = self.serve('app.css', HTTP_ACCEPT_ENCODING='br')['ETag']
+
+        for if_none_match in (etag, 'W/' + etag, '"other", ' + etag, '*'):
+            response = self.serve('app.css', HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=if_none_match)
+
+            self.assertEqual(response.status_code, 304, if_none_match)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_etag_of_another_encoding(self):
+        etag = self.serve('app.css', HTTP_ACCEPT_ENCODING='br')['ETag']
+        response = self.serve('app.css', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ServeDictionaryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.dictionary = b'.btn{color:red}' * 10
+        self.digest = hashlib.sha256(self.dictionary).digest()
+        self.dictionary_name = 'static_compressor/dictionary.{version}.dict'.format(version=self.digest.hex()[:12])
+        for (name, content) in (
+                ('app.css', CONTENT),
+                ('app.css.br', brotli.compress(CONTENT)),
+                ('app.css.dcz', DCZ_MAGIC + self.digest + b'compressed'),
+                (self.dictionary_name, self.dictionary)):
+            path = os.path.join(self.directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+
+        with override_settings(STATIC_COMPRESS_METHODS=['gz', 'br']):
+            self.index = CompressedFilesIndex(CompressedStaticFilesStorage(location=self.directory))
+        self.request_factory = RequestFactory()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def serve(self, name, **headers):
+        return serve_compressed(self.request_factory.get('/static/' + name, **headers), self.index, name)
+
+    def test_dictionary(self):
+        response = self.serve(self.dictionary_name)
+
+        self.assertEqual(response['Use-As-Dictionary'], 'match="/static/*"')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(b''.join(response.streaming_content), self.dictionary)
+
+    def test_negotiation(self):
+        available_dictionary = ':{digest}:'.format(digest=base64.b64encode(self.digest).decode())
+        other_dictionary = ':{digest}:'.format(digest=base64.b64encode(b'\0' * 32).decode())
+
+        for (accept_encoding, dictionary, encoding) in (
+                ('br, dcz', available_dictionary, 'dcz'),
+                ('br', available_dictionary, 'br'),
+                ('br, dcz', other_dictionary, 'br'),
+                ('br, dcz', 'invalid', 'br'),
+                ('br, dcz', '', 'br'),
+                ('*', available_dictionary, 'br')):
+            response = self.serve('app.css', HTTP_ACCEPT_ENCODING=accept_encoding,
+                                  HTTP_AVAILABLE_DICTIONARY=dictionary)
+
+            self.assertEqual(response['Content-Encoding'], encoding, (accept_encoding, dictionary))
+            self.assertEqual(response['Vary'], 'Accept-Encoding, Available-Dictionary')
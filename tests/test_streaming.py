@@ -0,0 +1,80 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from django.test import override_settings
+
+from static_compressor.middleware import MinifyClassMiddleware, StreamingRewrite
+
+CLASS_MAP = {'btn-primary': 'a', 'btn': 'b', 'card': 'c', 'a': 'z', 'ad': 'q', 'nav': 'n'}
+
+FRAGMENTS = [
+    '<div class="btn card">x</div>',
+    '<STYLE>.btn{} .card .ad{}</STYLE>',
+    '<style class="nav">\n.nav:hover{}\n</style>',
+    "<script>el.classList.add('btn');q.querySelector('.card')</script>",
+    '<SCRIPT class="btn">x.classList.toggle("nav")</SCRIPT>',
+    '<p>plain é text</p>',
+    '<span class = "a ad btn-primary">',
+    ' text > more ',
+    '<script src="x.js"></script>',
+]
+
+
+class StreamingRewriteTest(unittest.TestCase):
+    """
+    A streaming response split anywhere gives the same body as the buffered
+    response.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        json_file_name = os.path.join(self.directory, 'data.json')
+        with open(json_file_name, 'w') as f:
+            json.dump(CLASS_MAP, f)
+
+        with override_settings(
+                STATIC_CLASSES_FILE_NAME=json_file_name,
+                MINIFY_CLASS_HTML=True,
+                STATIC_INLINE_CSS=True,
+                STATIC_INLINE_JS=True):
+            self.middleware = MinifyClassMiddleware(lambda request: None)
+        self.rewriter = self.middleware.class_map.get()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def stream(self, content, charset, random_split):
+        streaming = StreamingRewrite(self.middleware, self.rewriter, charset)
+        chunks = list()
+        start = 0
+        while start < len(content):
+            end = start + random_split.randint(1, 20)
+            chunks.append(streaming.feed(content[start:end]))
+            start = end
+        chunks.append(streaming.close())
+        return b''.join(chunks)
+
+    def check_random_splits(self, charset, seed):
+        random_split = random.Random(seed)
+        for _ in range(200):
+            html = ''.join(random_split.choice(FRAGMENTS) for _ in range(random_split.randint(1, 12)))
+            content = html.encode(charset)
+            (expected, count) = self.middleware._rewrite_bytes(content, self.rewriter, charset)
+
+            self.assertEqual(self.stream(content, charset, random_split), expected, html)
+
+    def test_ascii_compatible_charset(self):
+        self.check_random_splits('utf-8', 1)
+
+    def test_decoded_charset(self):
+        self.check_random_splits('utf-16', 2)
+
+    def test_rewritten(self):
+        content = '<div class="btn card"><style>.btn{}</style>'.encode()
+
+        self.assertEqual(self.stream(content, 'utf-8', random.Random(0)),
+                         b'<div class="b c"><style>.b{}</style>')